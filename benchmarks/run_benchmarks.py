@@ -0,0 +1,323 @@
+"""
+Benchmark ingest, full-text, vector and hybrid search against a local PostgreSQL.
+
+Generates a synthetic caption and embedding dataset, loads it into a fresh
+table, and measures:
+
+- insert_dataframe throughput (rows/s) for the INSERT and COPY paths
+- full_text_search latency (p50/p95/p99) without and with the GIN index
+- vector_search latency without an index (exact) and with HNSW and IVFFlat
+  indexes, plus recall@k of the approximate indexes against exact search
+- search_hybrid latency without and with indexes
+
+Results are written as JSON so that runs can be compared over time.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 100000 --dim 512
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from loguru import logger
+
+from pgsql_search.database import (
+    Column,
+    ColumnType,
+    DistanceMetric,
+    PostgreSQLDatabase,
+    VectorIndexMethod,
+)
+
+TABLE_NAME = "benchmark_items"
+
+VOCABULARY = (
+    "a an the man woman child dog cat bird horse car bus train bike boat plane "
+    "red blue green yellow black white small large old young happy running "
+    "sitting standing eating playing riding walking holding looking street "
+    "park beach field kitchen table room road water snow grass tree building "
+    "shirt hat ball frisbee umbrella phone pizza cake plate bench fence window"
+).split()
+
+
+def make_synthetic_data(
+    num_rows: int, dim: int, num_clusters: int = 100, seed: int = 0
+) -> pd.DataFrame:
+    """
+    Generate random captions and clustered, L2-normalized embeddings.
+
+    Embeddings are drawn around `num_clusters` random centers so that nearest
+    neighbour search behaves more like it does on real image embeddings than
+    on uniform noise.
+    """
+    rng = np.random.default_rng(seed)
+    words = np.array(VOCABULARY)
+    caption_lengths = rng.integers(6, 16, size=num_rows)
+    captions = [" ".join(rng.choice(words, size=n)) for n in caption_lengths]
+
+    centers = rng.standard_normal((num_clusters, dim)).astype(np.float32)
+    assignments = rng.integers(0, num_clusters, size=num_rows)
+    embeddings = centers[assignments] + 0.5 * rng.standard_normal(
+        (num_rows, dim)
+    ).astype(np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    return pd.DataFrame(
+        {
+            "image_filepath": [f"/data/images/{i:09d}.jpg" for i in range(num_rows)],
+            "caption": captions,
+            "img_emb": list(embeddings),
+        }
+    )
+
+
+def make_queries(
+    df: pd.DataFrame, num_queries: int, seed: int = 1
+) -> tuple[list[str], np.ndarray]:
+    """
+    Generate text queries from the vocabulary and query vectors near stored rows.
+    """
+    rng = np.random.default_rng(seed)
+    texts = [
+        " ".join(rng.choice(VOCABULARY, size=rng.integers(2, 5)))
+        for _ in range(num_queries)
+    ]
+    rows = rng.integers(0, len(df), size=num_queries)
+    embeddings = np.stack(df["img_emb"].to_numpy()[rows])
+    embeddings = embeddings + 0.1 * rng.standard_normal(embeddings.shape).astype(
+        np.float32
+    )
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return texts, embeddings.astype(np.float32)
+
+
+def latency_stats(timings: list[float]) -> dict[str, float]:
+    """
+    Summarize per-query latencies, in milliseconds.
+    """
+    ms = np.array(timings) * 1000
+    return {
+        "count": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def time_queries(search, queries) -> tuple[dict[str, float], list]:
+    """
+    Run `search` once per query and return latency stats and the results.
+    """
+    timings = []
+    results = []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        timings.append(time.perf_counter() - start)
+    return latency_stats(timings), results
+
+
+def exact_neighbours(
+    embeddings: np.ndarray, queries: np.ndarray, k: int
+) -> list[set[int]]:
+    """
+    Compute exact cosine nearest neighbours, as 1-based row ids.
+    """
+    neighbours = []
+    for query in queries:
+        scores = embeddings @ query
+        top = np.argpartition(-scores, k)[:k]
+        neighbours.append({int(i) + 1 for i in top})
+    return neighbours
+
+
+def recall_at_k(results: list[pd.DataFrame], truth: list[set[int]]) -> float:
+    hits = sum(len(set(res["id"]) & expected) for res, expected in zip(results, truth))
+    return hits / sum(len(expected) for expected in truth)
+
+
+def create_table(db: PostgreSQLDatabase, dim: int) -> None:
+    db.initialize_table(TABLE_NAME)
+    db.add_columns(
+        Column("image_filepath", ColumnType.TEXT),
+        Column("caption", ColumnType.TEXT),
+        Column("img_emb", ColumnType.VECTOR, vector_dim=dim),
+    )
+
+
+def benchmark_ingest(
+    db: PostgreSQLDatabase, df: pd.DataFrame, dim: int, insert_rows: int
+) -> dict:
+    """
+    Measure rows/s of the INSERT path on a sample and the COPY path on all rows.
+    """
+    results = {}
+    sample = df.iloc[:insert_rows]
+    for method, data in (("insert", sample), ("copy", df)):
+        create_table(db, dim)
+        start = time.perf_counter()
+        db.insert_dataframe(data, method=method)
+        elapsed = time.perf_counter() - start
+        results[method] = {
+            "rows": len(data),
+            "seconds": elapsed,
+            "rows_per_second": len(data) / elapsed,
+        }
+        logger.info(f"Ingest {method}: {results[method]['rows_per_second']:.0f} rows/s")
+    return results
+
+
+def run(args: argparse.Namespace) -> dict:
+    df = make_synthetic_data(args.rows, args.dim, seed=args.seed)
+    texts, query_embeddings = make_queries(df, args.queries, seed=args.seed + 1)
+    embeddings = np.stack(df["img_emb"].to_numpy())
+    truth = exact_neighbours(embeddings, query_embeddings, args.k)
+
+    results = {}
+    PostgreSQLDatabase.create_database(args.database)
+    with PostgreSQLDatabase(args.database) as db:
+        results["ingest"] = benchmark_ingest(db, df, args.dim, args.insert_rows)
+        db.cur.execute(f"ANALYZE {TABLE_NAME}")
+        db.conn.commit()
+
+        def fts(query):
+            return db.full_text_search(query, TABLE_NAME, "caption", args.k)
+
+        def vector(embedding, **kwargs):
+            return db.vector_search(embedding, TABLE_NAME, "img_emb", args.k, **kwargs)
+
+        def hybrid(pair):
+            query, embedding = pair
+            return db.search_hybrid(
+                query, embedding, TABLE_NAME, "caption", "img_emb", args.k
+            )
+
+        hybrid_queries = list(zip(texts, query_embeddings))
+
+        results["fts"] = {"no_index": time_queries(fts, texts)[0]}
+        results["vector"] = {}
+        stats, exact_results = time_queries(vector, query_embeddings)
+        results["vector"]["exact"] = {
+            **stats,
+            "recall": recall_at_k(exact_results, truth),
+        }
+        results["hybrid"] = {"no_index": time_queries(hybrid, hybrid_queries)[0]}
+
+        db.create_fts_index(TABLE_NAME, "caption")
+        results["fts"]["gin"] = time_queries(fts, texts)[0]
+
+        index_builds = {
+            "hnsw": dict(method=VectorIndexMethod.HNSW),
+            "ivfflat": dict(
+                method=VectorIndexMethod.IVFFLAT, lists=max(1, args.rows // 1000)
+            ),
+        }
+        for name, build in index_builds.items():
+            start = time.perf_counter()
+            index_name = db.create_vector_index(
+                TABLE_NAME,
+                "img_emb",
+                metric=DistanceMetric.COSINE,
+                maintenance_work_mem=args.maintenance_work_mem,
+                **build,
+            )
+            build_seconds = time.perf_counter() - start
+
+            knobs = (
+                {"ef_search": args.ef_search}
+                if name == "hnsw"
+                else {"probes": args.probes}
+            )
+            stats, approx_results = time_queries(
+                lambda embedding, knobs=knobs: vector(embedding, **knobs),
+                query_embeddings,
+            )
+            results["vector"][name] = {
+                **stats,
+                **knobs,
+                "build_seconds": build_seconds,
+                "recall": recall_at_k(approx_results, truth),
+            }
+            results["hybrid"][name] = time_queries(hybrid, hybrid_queries)[0]
+            logger.info(
+                f"{name}: recall@{args.k}={results['vector'][name]['recall']:.3f}, "
+                f"p50={stats['p50_ms']:.2f}ms"
+            )
+
+            db.cur.execute(f"DROP INDEX {index_name}")
+            db.conn.commit()
+
+    return results
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--database", default="benchmark_db")
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=512)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument(
+        "--insert-rows",
+        type=int,
+        default=10_000,
+        help="Rows loaded with the INSERT path, which is much slower than COPY",
+    )
+    parser.add_argument("--ef-search", type=int, default=40)
+    parser.add_argument("--probes", type=int, default=10)
+    parser.add_argument("--maintenance-work-mem", default="1GB")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=None,
+        help="JSON results file (default: benchmarks/results/<timestamp>.json)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+    started_at = datetime.now(timezone.utc)
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            key: str(value) if isinstance(value, Path) else value
+            for key, value in vars(args).items()
+        },
+        "results": run(args),
+    }
+
+    output = args.output or (
+        Path(__file__).parent
+        / "results"
+        / f"{started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    logger.info(f"Wrote benchmark results to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,11 @@
-import time
 from dataclasses import dataclass
 from decimal import Decimal
 from typing import List
 
 from loguru import logger
 
+from pgsql_search.metrics import Metrics
+
 
 @dataclass
 class Result:
@@ -16,29 +17,40 @@ class Result:
 class HybridSearch:
     """
     Hybrid search class that combines caption vector search and caption keyword search
+
+    Each search records embedding, execute, fetch and materialize timings in
+    `metrics.last`.
     """
 
-    def __init__(self, conn, model, num_results: int = 12, k: int = 60):
+    def __init__(
+        self,
+        conn,
+        model,
+        num_results: int = 12,
+        k: int = 60,
+        metrics: Metrics | None = None,
+    ):
         self.conn = conn
         self.model = model
+        self.metrics = metrics or Metrics()
 
         self.num_results = num_results
         self.k = k
 
     def build_search_query(self) -> str:
-        return f"""
+        return """
         WITH text_to_image_vector_search AS (
             SELECT image_id, image_filepath, RANK () OVER (ORDER BY img_emb <=> %(embedding)s) AS rank
             FROM image_metadata
             ORDER BY img_emb <=> %(embedding)s
-            LIMIT {self.num_results}
+            LIMIT %(num_results)s
         ),
         caption_keyword_search AS (
             SELECT image_id, image_filepath, RANK () OVER (ORDER BY ts_rank_cd(to_tsvector('english', recaption), query) DESC)
             FROM image_metadata, plainto_tsquery('english', %(query)s) query
             WHERE to_tsvector('english', recaption) @@ query
             ORDER BY ts_rank_cd(to_tsvector('english', recaption), query) DESC
-            LIMIT {self.num_results}
+            LIMIT %(num_results)s
         )
         SELECT
             COALESCE(text_to_image_vector_search.image_id, caption_keyword_search.image_id) AS id,
@@ -48,25 +60,38 @@ class HybridSearch:
         FROM text_to_image_vector_search
         FULL OUTER JOIN caption_keyword_search ON text_to_image_vector_search.image_id = caption_keyword_search.image_id
         ORDER BY score DESC
-        LIMIT {self.num_results}
+        LIMIT %(num_results)s
         """
 
     def search(self, query: str) -> List[Result]:
         logger.info("Executing search")
         try:
-            input_text_embeddings = self.model.encode_text(query)
-            sql = self.build_search_query()
-            t = time.time()
-            results = self.conn.execute(
-                sql, {"query": query, "embedding": input_text_embeddings, "k": self.k}
-            ).fetchall()
-
-            logger.info(f"Search executed in {time.time() - t:.4f} seconds")
-            results = [
-                Result(id=row[0], image_filename=row[1], rrf_score=row[2])
-                for row in results
-            ]
+            with self.metrics.operation("hybrid_search") as timings:
+                with timings.stage("embedding"):
+                    input_text_embeddings = self.model.encode_text(query)
+                sql = self.build_search_query()
+                with timings.stage("execute"):
+                    cur = self.conn.execute(
+                        sql,
+                        {
+                            "query": query,
+                            "embedding": input_text_embeddings,
+                            "k": self.k,
+                            "num_results": self.num_results,
+                        },
+                    )
+                with timings.stage("fetch"):
+                    rows = cur.fetchall()
+                with timings.stage("materialize"):
+                    results = [
+                        Result(id=row[0], image_filename=row[1], rrf_score=row[2])
+                        for row in rows
+                    ]
 
+            logger.info(
+                f"Search executed in {timings.total:.4f} seconds "
+                + ", ".join(f"{stage}={t:.4f}" for stage, t in timings.stages.items())
+            )
             return results
         except Exception as e:
             logger.error(f"Error executing search: {str(e)}")
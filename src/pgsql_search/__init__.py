@@ -1,5 +1,26 @@
-__version__ = "0.1.0"
+import importlib
 
+__version__ = "0.1.0"
 
-from .core import *
+__all__ = ["search_fts"]
 # from .models import CLIP
+
+_SUBMODULES = {
+    "async_database",
+    "cache",
+    "core",
+    "database",
+    "loader",
+    "metrics",
+    "models",
+}
+
+
+def __getattr__(name: str):
+    # Submodules and the functions of `core` are only imported on first use, so
+    # that `import pgsql_search` does not pull in pandas, datasets or torch
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name in __all__:
+        return getattr(importlib.import_module(".core", __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
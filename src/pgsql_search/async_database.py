@@ -0,0 +1,582 @@
+import itertools
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any
+
+import psycopg
+from loguru import logger
+
+from .database import (
+    _TABLE_COLUMNS_SQL,
+    DistanceMetric,
+    _cast_integer_rows,
+    _copy_sql,
+    _explain_sql,
+    _filter_params,
+    _float32_vector,
+    _fts_sql,
+    _hybrid_search_sql,
+    _insert_sql,
+    _iter_dataframe_rows,
+    _materialize,
+    _quantize_rows,
+    _quantized_columns,
+    _search_settings,
+    _set_config,
+    _table_columns_from_rows,
+    _vector_search_sql,
+)
+from .metrics import Metrics, OperationTimings
+
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    from psycopg_pool import AsyncConnectionPool
+
+
+async def _configure_connection(conn: psycopg.AsyncConnection) -> None:
+    """
+    Prepare a new pooled connection. Runs once per physical connection.
+    """
+    from pgvector.psycopg import register_vector_async
+
+    await register_vector_async(conn)
+    # Leave the connection idle, as required by the pool
+    await conn.commit()
+
+
+class AsyncPostgreSQLDatabase:
+    """
+    Asyncio counterpart of `PostgreSQLDatabase` built on `psycopg.AsyncConnection`.
+
+    Only the request path is covered: `full_text_search`, `vector_search`,
+    `search_hybrid` and `insert_dataframe`. They build their statements with
+    the same SQL builders as the synchronous methods and take the same keyword
+    arguments, so results have the same columns and row types. Tables, columns
+    and indexes are created with `PostgreSQLDatabase`, which owns the
+    `Column`/`ColumnType` schema model.
+
+    A single connection serves one query at a time. To run many queries
+    concurrently, create a pool with `create_pool` and pass it in; every call
+    then borrows its own connection.
+
+    Examples:
+        async with AsyncPostgreSQLDatabase("my_database") as db:
+            res = await db.full_text_search("man in a yellow shirt", "image_metadata", "caption")
+
+        pool = await AsyncPostgreSQLDatabase.create_pool("my_database", max_size=20)
+        db = AsyncPostgreSQLDatabase("my_database", pool=pool)
+        results = await asyncio.gather(
+            *(db.full_text_search(q, "image_metadata", "caption") for q in queries)
+        )
+    """
+
+    def __init__(
+        self,
+        database_name: str,
+        pool: "AsyncConnectionPool | None" = None,
+        prepare_threshold: int | None = 5,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.database_name = database_name
+        self.pool = pool
+        self.prepare_threshold = prepare_threshold
+        self.metrics = metrics or Metrics()
+        self.conn = None
+        self._table_columns: dict[str, dict[str, str]] = {}
+
+    async def __aenter__(self):
+        if self.pool is None:
+            await self.connect()
+            await self.setup_pgvector_extension()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.pool is None:
+            await self.disconnect()
+        if exc_type:
+            logger.error(f"Error: {exc_type} - {exc_val}")
+            return False
+        return True
+
+    async def connect(self):
+        try:
+            self.conn = await psycopg.AsyncConnection.connect(
+                dbname=self.database_name, prepare_threshold=self.prepare_threshold
+            )
+            logger.info("Connected to database")
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            raise
+
+    async def disconnect(self):
+        try:
+            await self.conn.close()
+            logger.info("Disconnected from database")
+        except Exception as e:
+            logger.error(f"Error disconnecting from database: {e}")
+
+    async def setup_pgvector_extension(self):
+        try:
+            await self.conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            await self.conn.commit()
+            from pgvector.psycopg import register_vector_async
+
+            await register_vector_async(self.conn)
+            logger.info("pgvector extension initialized")
+        except Exception as e:
+            logger.error(f"Error creating pgvector extension: {e}")
+
+    @staticmethod
+    async def create_pool(
+        database_name: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        prepare_threshold: int | None = 5,
+        **kwargs,
+    ) -> "AsyncConnectionPool":
+        """
+        Create an async connection pool for the database.
+
+        The pgvector extension is created once up front, and each pooled
+        connection registers the pgvector types once when it is opened.
+        Requires the `psycopg_pool` package.
+
+        Args:
+            database_name: Name of the database to connect to
+            min_size: Number of connections kept open by the pool
+            max_size: Maximum number of connections the pool may open
+            prepare_threshold: Number of executions after which a statement is
+                prepared server-side on a connection. None disables prepared
+                statements, e.g. behind a transaction-pooling PgBouncer
+            **kwargs: Extra arguments passed to `psycopg_pool.AsyncConnectionPool`
+
+        Returns:
+            An open `psycopg_pool.AsyncConnectionPool`. Close it when done.
+        """
+        from psycopg_pool import AsyncConnectionPool
+
+        try:
+            async with await psycopg.AsyncConnection.connect(
+                dbname=database_name, autocommit=True
+            ) as conn:
+                await conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+            pool = AsyncConnectionPool(
+                kwargs={
+                    "dbname": database_name,
+                    "prepare_threshold": prepare_threshold,
+                },
+                min_size=min_size,
+                max_size=max_size,
+                configure=_configure_connection,
+                open=False,
+                **kwargs,
+            )
+            await pool.open()
+            logger.info(
+                f"Created async connection pool for '{database_name}' "
+                f"(min_size={min_size}, max_size={max_size})"
+            )
+            return pool
+        except Exception as e:
+            logger.error(f"Error creating connection pool: {e}")
+            raise
+
+    @asynccontextmanager
+    async def _cursor(self) -> AsyncIterator[psycopg.AsyncCursor]:
+        """
+        Yield a cursor for a single call, borrowing a pooled connection if any.
+        """
+        if self.pool is None:
+            if self.conn is None:
+                raise RuntimeError(
+                    "Not connected. Use 'async with' or call connect first."
+                )
+            async with self.conn.cursor() as cur:
+                yield cur
+        else:
+            async with self.pool.connection() as conn, conn.cursor() as cur:
+                yield cur
+
+    async def _get_table_columns(
+        self, cur: psycopg.AsyncCursor, table_name: str
+    ) -> dict[str, str]:
+        """
+        Return the columns of a table mapped to their PostgreSQL type names.
+        """
+        if table_name not in self._table_columns:
+            await cur.execute(_TABLE_COLUMNS_SQL, (table_name,))
+            self._table_columns[table_name] = _table_columns_from_rows(
+                await cur.fetchall()
+            )
+        return self._table_columns[table_name]
+
+    async def insert_dataframe(
+        self,
+        df: "pd.DataFrame",
+        table_name: str,
+        batch_size: int = 1000,
+        method: str = "copy",
+        commit_every: int | None = None,
+        binary: bool = True,
+        quantize: dict[str, str] | None = None,
+    ):
+        """
+        Insert data from a pandas DataFrame into an existing table.
+        Automatically matches DataFrame columns with table columns, and
+        quantizes vectors for halfvec and bit columns like
+        `PostgreSQLDatabase.insert_dataframe`.
+
+        Args:
+            df: pandas DataFrame containing the data
+            table_name: Name of the table to insert into
+            batch_size: Number of rows to insert in each batch (default: 1000)
+            method: "copy" to stream the rows through COPY or "insert" for
+                batched INSERT statements
+            commit_every: With method="copy", commit after this many rows.
+                None loads everything in a single transaction
+            binary: With method="copy", use the binary COPY format
+            quantize: Mapping of halfvec or bit table columns to the DataFrame
+                column to quantize into them
+        """
+        if method not in ("insert", "copy"):
+            raise ValueError(
+                f"Unknown insert method '{method}', use 'insert' or 'copy'"
+            )
+
+        try:
+            with self.metrics.operation("insert_dataframe") as timings:
+                async with self._cursor() as cur:
+                    table_columns = await self._get_table_columns(cur, table_name)
+                    valid_columns = [col for col in df.columns if col in table_columns]
+                    if not valid_columns:
+                        raise ValueError(
+                            "No matching columns found between DataFrame and table"
+                        )
+
+                    columns, sources = _quantized_columns(
+                        valid_columns, quantize, table_columns
+                    )
+                    types = [table_columns[col] for col in columns]
+                    rows = _quantize_rows(
+                        _iter_dataframe_rows(
+                            df[sources].set_axis(columns, axis=1), batch_size
+                        ),
+                        types,
+                    )
+                    start = time.perf_counter()
+                    total_rows = 0
+
+                    with timings.stage("write"):
+                        if method == "copy":
+                            copy_sql = _copy_sql(table_name, columns, binary)
+                            rows = _cast_integer_rows(rows, types)
+                            while True:
+                                written = 0
+                                async with cur.copy(copy_sql) as copy:
+                                    if binary:
+                                        copy.set_types(types)
+                                    for row in itertools.islice(rows, commit_every):
+                                        await copy.write_row(row)
+                                        written += 1
+                                total_rows += written
+                                if commit_every is None or written < commit_every:
+                                    break
+                                await cur.connection.commit()
+                                logger.info(
+                                    f"Copied {total_rows} rows into {table_name}"
+                                )
+                        else:
+                            insert_sql = _insert_sql(table_name, columns)
+                            while batch := list(itertools.islice(rows, batch_size)):
+                                await cur.executemany(insert_sql, batch)
+                                await cur.connection.commit()
+                                total_rows += len(batch)
+
+                        await cur.connection.commit()
+                    timings.rows = total_rows
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Successfully inserted {total_rows} rows into {table_name} "
+                f"in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/s, method={method})"
+            )
+
+            skipped_columns = set(df.columns) - set(valid_columns)
+            if skipped_columns:
+                logger.warning(f"Skipped columns not in table: {skipped_columns}")
+
+        except Exception as e:
+            logger.error(f"Error inserting data: {e}")
+            raise
+
+    async def full_text_search(
+        self,
+        query: str,
+        table_name: str,
+        search_column: str,
+        num_results: int = 10,
+        config: str = "english",
+        return_dataframe: bool = True,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
+        """
+        Perform a full-text search on the table.
+
+        Runs the same statement as `PostgreSQLDatabase.full_text_search`,
+        including the use of a stored tsvector column when one exists.
+
+        Args:
+            query: Search query string
+            table_name: Name of the table to search
+            search_column: Column to perform the search on
+            num_results: Maximum number of results to return
+            config: Text search configuration, must match the one used to index
+            return_dataframe: If True, returns results as pandas DataFrame
+            filters: Column values to match, e.g. {"source": "coco"} or
+                {"source": ["coco", "flickr"]}
+            parallel_workers: Parallel workers per query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" for a pyarrow Table or "numpy" for a dict of
+                NumPy arrays, as in `PostgreSQLDatabase.vector_search`
+
+        Returns:
+            Either pd.DataFrame or a list of named tuples depending on
+            return_dataframe parameter
+        """
+        filter_key, filter_params = _filter_params(filters)
+        settings = _search_settings(parallel_workers=parallel_workers)
+        try:
+            with self.metrics.operation("full_text_search") as timings:
+                async with self._cursor() as cur:
+                    sql = _fts_sql(
+                        table_name,
+                        search_column,
+                        tuple((await self._get_table_columns(cur, table_name)).items()),
+                        config,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = await self._run_search(
+                        cur,
+                        sql,
+                        {"query": query, "num_results": num_results, **filter_params},
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
+
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
+
+        except Exception as e:
+            logger.error(f"Error performing text search: {e}")
+            raise
+
+    async def vector_search(
+        self,
+        query_embedding: "np.ndarray | list[float]",
+        table_name: str,
+        vector_column: str,
+        num_results: int = 10,
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        ef_search: int | None = None,
+        probes: int | None = None,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
+        """
+        Find the rows whose vectors are closest to a query embedding.
+
+        Runs the same statement as `PostgreSQLDatabase.vector_search`.
+
+        Args:
+            query_embedding: Query vector, e.g. from `CLIP.encode_text`
+            table_name: Name of the table to search
+            vector_column: Vector column to search
+            num_results: Maximum number of results to return
+            metric: Distance metric, must match the index to use it
+            ef_search: HNSW candidate list size for this query
+            probes: IVFFlat number of lists to visit for this query
+            filters: Column values to match, as in `full_text_search`
+            parallel_workers: Parallel workers per query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" for a pyarrow Table or "numpy" for a dict of
+                NumPy arrays, as in `PostgreSQLDatabase.vector_search`
+            return_dataframe: If False, returns a list of named tuples instead
+                of a pandas DataFrame
+
+        Returns:
+            pd.DataFrame with the matching rows and their distance, vector
+            columns excluded
+        """
+        filter_key, params = _filter_params(filters)
+        settings = _search_settings(ef_search, probes, parallel_workers)
+        params = {
+            **params,
+            "embedding": _float32_vector(query_embedding),
+            "num_results": num_results,
+        }
+        try:
+            with self.metrics.operation("vector_search") as timings:
+                async with self._cursor() as cur:
+                    sql = _vector_search_sql(
+                        table_name,
+                        vector_column,
+                        tuple((await self._get_table_columns(cur, table_name)).items()),
+                        metric,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = await self._run_search(
+                        cur, sql, params, timings, settings, binary=columnar is not None
+                    )
+
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
+
+        except Exception as e:
+            logger.error(f"Error performing vector search: {e}")
+            raise
+
+    async def search_hybrid(
+        self,
+        query: str,
+        query_embedding: "np.ndarray | list[float]",
+        table_name: str,
+        text_column: str,
+        vector_column: str,
+        num_results: int = 10,
+        text_candidates: int = 40,
+        vector_candidates: int = 40,
+        text_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        text_k: int = 60,
+        vector_k: int = 60,
+        id_column: str = "id",
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        config: str = "english",
+        ef_search: int | None = None,
+        probes: int | None = None,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
+        """
+        Combine full-text and vector search with Reciprocal Rank Fusion (RRF).
+
+        Runs the same statement as `PostgreSQLDatabase.search_hybrid`; see there
+        for the meaning of the arguments.
+
+        Returns:
+            pd.DataFrame with the matching rows, their fused `score`, and their
+            `text_rank` and `vector_rank` (None when a leg did not return the row)
+        """
+        filter_key, params = _filter_params(filters)
+        settings = _search_settings(ef_search, probes, parallel_workers)
+        params = {
+            **params,
+            "query": query,
+            "embedding": _float32_vector(query_embedding),
+            "num_results": num_results,
+            "text_candidates": text_candidates,
+            "vector_candidates": vector_candidates,
+            "text_weight": text_weight,
+            "vector_weight": vector_weight,
+            "text_k": text_k,
+            "vector_k": vector_k,
+        }
+        try:
+            with self.metrics.operation("search_hybrid") as timings:
+                async with self._cursor() as cur:
+                    sql = _hybrid_search_sql(
+                        table_name,
+                        text_column,
+                        vector_column,
+                        id_column,
+                        tuple((await self._get_table_columns(cur, table_name)).items()),
+                        metric,
+                        config,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = await self._run_search(
+                        cur, sql, params, timings, settings, binary=columnar is not None
+                    )
+
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
+
+        except Exception as e:
+            logger.error(f"Error performing hybrid search: {e}")
+            raise
+
+    async def _run_search(
+        self,
+        cur: psycopg.AsyncCursor,
+        sql: str,
+        params: dict[str, Any],
+        timings: OperationTimings,
+        settings: dict[str, str] | None = None,
+        binary: bool = False,
+    ) -> tuple[list[str], list[tuple]]:
+        """
+        Execute a search statement and return its column names and rows.
+
+        Per-query settings are sent together with the statement in a single
+        round trip and only last for the transaction, which is then committed.
+        Timings, binary results and EXPLAIN capture work as in
+        `PostgreSQLDatabase._run_search`.
+        """
+        if settings:
+            async with cur.connection.pipeline():
+                await cur.execute(*_set_config(settings))
+                if self.metrics.explain:
+                    await self._explain(cur, sql, params, timings)
+                with timings.stage("execute"):
+                    await cur.execute(sql, params, binary=binary)
+                    results = await cur.fetchall()
+            await cur.connection.commit()
+        else:
+            if self.metrics.explain:
+                await self._explain(cur, sql, params, timings)
+            with timings.stage("execute"):
+                await cur.execute(sql, params, binary=binary)
+            with timings.stage("fetch"):
+                results = await cur.fetchall()
+
+        timings.rows = (timings.rows or 0) + len(results)
+        return [desc[0] for desc in cur.description], results
+
+    async def _explain(
+        self,
+        cur: psycopg.AsyncCursor,
+        sql: str,
+        params: dict[str, Any],
+        timings: OperationTimings,
+    ) -> None:
+        """
+        Record the executed plan of a search statement in `timings.explain`.
+        """
+        with timings.stage("explain"):
+            await cur.execute(_explain_sql(sql), params)
+            plan = (await cur.fetchone())[0]
+        timings.explain.append(plan)
+        logger.info(
+            f"EXPLAIN ANALYZE {timings.operation}: "
+            f"execution {plan[0]['Execution Time']:.2f}ms, "
+            f"planning {plan[0]['Planning Time']:.2f}ms"
+        )
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from collections.abc import Hashable
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from loguru import logger
+
+
+class LRUCache:
+    """
+    A thread-safe, bounded least-recently-used cache with hit/miss counters.
+
+    Examples:
+        cache = LRUCache(maxsize=2)
+        cache.put("a", 1)
+        cache.get("a")  # 1
+        cache.info()    # {"hits": 1, "misses": 0, "size": 1, "maxsize": 2}
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        Return the cached value for `key` and mark it as recently used.
+        """
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store `value` under `key`, evicting the least recently used entry if full.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+
+class EmbeddingCache:
+    """
+    A persistent on-disk store of embeddings for one model, keyed by content hash.
+
+    Embeddings are appended to a float32 file that is memory-mapped for reads,
+    so opening the cache only reads the keys, and cached vectors are paged in
+    from disk when they are used instead of being loaded or copied up front.
+    Keys are 16-byte BLAKE2b digests of the embedded content, appended to a
+    second file in the same order as the vectors. Each model id gets its own
+    directory under `cache_dir`.
+
+    Only one process should add to a cache directory at a time. A write that
+    was interrupted is dropped the next time the cache is opened.
+
+    Examples:
+        cache = EmbeddingCache("~/.cache/pgsql_search", "openai/clip-vit-base-patch32", 512)
+        key = EmbeddingCache.hash_file("cat.jpg")
+        if key not in cache:
+            cache.put([key], clip.encode_image(["cat.jpg"]))
+        cache.get(key)  # read-only view into the memory-mapped file
+    """
+
+    KEY_SIZE = 16
+
+    def __init__(self, cache_dir: str | os.PathLike, model_id: str, dim: int) -> None:
+        self.model_id = model_id
+        self.dim = dim
+        self.path = Path(cache_dir).expanduser() / model_id.replace("/", "--")
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._keys_path = self.path / "keys.bin"
+        self._vectors_path = self.path / "vectors.f32"
+        self._lock = threading.Lock()
+        self._vectors: np.memmap | None = None
+        self._check_meta()
+        self._load()
+
+    def _check_meta(self) -> None:
+        meta = {"model_id": self.model_id, "dim": self.dim, "dtype": "float32"}
+        meta_path = self.path / "meta.json"
+        if meta_path.exists():
+            stored = json.loads(meta_path.read_text())
+            if stored != meta:
+                raise ValueError(
+                    f"Embedding cache at {self.path} holds {stored}, not {meta}"
+                )
+        else:
+            meta_path.write_text(json.dumps(meta))
+
+    def _load(self) -> None:
+        """
+        Index the stored keys, dropping rows left incomplete by a failed write.
+        """
+        self._keys_path.touch()
+        self._vectors_path.touch()
+        keys = self._keys_path.read_bytes()
+        num_rows = min(
+            len(keys) // self.KEY_SIZE,
+            self._vectors_path.stat().st_size // (4 * self.dim),
+        )
+        for path, size in (
+            (self._keys_path, num_rows * self.KEY_SIZE),
+            (self._vectors_path, num_rows * 4 * self.dim),
+        ):
+            if path.stat().st_size != size:
+                logger.warning(f"Truncating incomplete embedding cache file {path}")
+                os.truncate(path, size)
+
+        self._index = {
+            keys[i * self.KEY_SIZE : (i + 1) * self.KEY_SIZE]: i
+            for i in range(num_rows)
+        }
+        self._num_rows = num_rows
+        logger.info(f"Opened embedding cache {self.path} with {num_rows} embeddings")
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """
+        All cached embeddings as a read-only (len(self), dim) memory map.
+        """
+        if self._num_rows == 0:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._vectors is None or len(self._vectors) != self._num_rows:
+            self._vectors = np.memmap(
+                self._vectors_path,
+                dtype=np.float32,
+                mode="r",
+                shape=(self._num_rows, self.dim),
+            )
+        return self._vectors
+
+    def lookup(self, keys: list[bytes | None]) -> np.ndarray:
+        """
+        Return the row of each key in `vectors`, or -1 for keys not cached.
+
+        None keys, e.g. of files that could not be hashed, are never cached.
+        """
+        with self._lock:
+            rows = np.array(
+                [-1 if key is None else self._index.get(key, -1) for key in keys],
+                dtype=np.int64,
+            )
+            found = int((rows >= 0).sum())
+            self.hits += found
+            self.misses += len(rows) - found
+        return rows
+
+    def get(self, key: bytes) -> np.ndarray | None:
+        """
+        Return the cached embedding for `key` without copying it, or None.
+        """
+        row = self.lookup([key])[0]
+        return None if row < 0 else self.vectors[row]
+
+    def put(self, keys: list[bytes], embeddings: np.ndarray) -> int:
+        """
+        Append the embeddings of keys that are not cached yet.
+
+        Returns:
+            The number of embeddings added
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            new = {}
+            for key, embedding in zip(keys, embeddings):
+                if key not in self._index and key not in new:
+                    new[key] = embedding
+            if not new:
+                return 0
+
+            # Vectors go first, so that a stored key always has its vector
+            with open(self._vectors_path, "ab") as f:
+                f.write(np.stack(list(new.values())).tobytes())
+            with open(self._keys_path, "ab") as f:
+                f.write(b"".join(new))
+            for key in new:
+                self._index[key] = self._num_rows
+                self._num_rows += 1
+        return len(new)
+
+    def info(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self)}
+
+    @classmethod
+    def hash_bytes(cls, data: bytes) -> bytes:
+        return hashlib.blake2b(data, digest_size=cls.KEY_SIZE).digest()
+
+    @classmethod
+    def hash_file(cls, path: str | os.PathLike, chunk_size: int = 1 << 20) -> bytes:
+        """
+        Return the key of a file's content.
+        """
+        digest = hashlib.blake2b(digest_size=cls.KEY_SIZE)
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                digest.update(chunk)
+        return digest.digest()
+
+    def __len__(self) -> int:
+        return self._num_rows
+
+    def __contains__(self, key: bytes) -> bool:
+        return key in self._index
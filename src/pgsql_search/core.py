@@ -1,11 +1,15 @@
 import glob
 from pathlib import Path
-
-import pandas as pd
-from datasets import Dataset
+from typing import TYPE_CHECKING
 
 from .database import PostgreSQLDatabase
-from .loader import HuggingFaceDatasets
+
+# pandas and datasets are slow to import and not needed to run searches
+if TYPE_CHECKING:
+    import pandas as pd
+    from datasets import Dataset
+
+    from .loader import HuggingFaceDatasets
 
 __all__ = ["search_fts"]
 
@@ -17,7 +21,7 @@ def search_fts(query: str):
     return query
 
 
-def insert_dataset(df: pd.DataFrame):
+def insert_dataset(df: "pd.DataFrame"):
     """
     Load a Hugging Face dataset into a PostgreSQL database.
     """
@@ -37,13 +41,67 @@ def embed_text():
     pass
 
 
-def search_image():
-    pass
+def search_image(
+    database_name: str,
+    table_name: str,
+    vector_column: str,
+    image_path: str | None = None,
+    row_id=None,
+    model=None,
+    **kwargs,
+) -> "pd.DataFrame":
+    """
+    Find the images most similar to a query image.
+
+    The query is either an image file, embedded with CLIP, or a stored row whose
+    embedding is reused. Pass the same `model` as was used to embed the table;
+    a default `CLIP` is loaded otherwise. See `PostgreSQLDatabase.vector_search`
+    for the available options.
+
+    Examples:
+        search_image("my_database", "image_metadata", "img_emb", "query.jpg")
+        search_image("my_database", "image_metadata", "img_emb", row_id=42)
+    """
+    if (image_path is None) == (row_id is None):
+        raise ValueError("Pass exactly one of image_path and row_id")
+
+    with PostgreSQLDatabase(database_name) as db:
+        if row_id is not None:
+            return db.vector_search_by_id(row_id, table_name, vector_column, **kwargs)
+
+        import numpy as np
+
+        with db.metrics.operation("search_image") as timings:
+            with timings.stage("embedding"):
+                if model is None:
+                    from .models import CLIP
+
+                    model = CLIP()
+                embedding = model.encode_image([image_path])[0]
+            if np.isnan(embedding).any():
+                raise ValueError(f"Could not load query image {image_path}")
+            return db.vector_search(embedding, table_name, vector_column, **kwargs)
 
 
 def search_text():
     pass
 
 
-def search_hybrid():
-    pass
+def search_hybrid(
+    database_name: str,
+    query: str,
+    query_embedding,
+    table_name: str,
+    text_column: str,
+    vector_column: str,
+    **kwargs,
+) -> "pd.DataFrame":
+    """
+    Run a hybrid full-text and vector search with Reciprocal Rank Fusion.
+
+    See `PostgreSQLDatabase.search_hybrid` for the available options.
+    """
+    with PostgreSQLDatabase(database_name) as db:
+        return db.search_hybrid(
+            query, query_embedding, table_name, text_column, vector_column, **kwargs
+        )
@@ -1,13 +1,1103 @@
+import base64
+import functools
+import itertools
+import json
+import sys
+import time
+from collections import namedtuple
+from collections.abc import Iterable, Iterator
+from contextlib import closing, contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
-import pandas as pd
 import psycopg
-from itables import show
 from loguru import logger
-from pgvector.psycopg import register_vector
+
+from .metrics import Metrics, OperationTimings
+
+# numpy, pandas, pyarrow and pgvector are imported where they are first
+# needed, so that importing this module stays fast for processes that only
+# run searches
+if TYPE_CHECKING:
+    import numpy as np
+    import pandas as pd
+    import pyarrow as pa
+    from psycopg_pool import ConnectionPool
+
+
+def _is_array(value: Any) -> bool:
+    """
+    Check whether `value` is a NumPy array, without importing NumPy.
+    """
+    numpy = sys.modules.get("numpy")
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def _float32_vector(value: "np.ndarray | list[float]") -> "np.ndarray":
+    import numpy as np
+
+    return np.asarray(value, dtype=np.float32)
+
+
+def _to_dataframe(rows: list[tuple], columns: list[str]) -> "pd.DataFrame":
+    import pandas as pd
+
+    return pd.DataFrame(rows, columns=columns)
+
+
+@functools.lru_cache(maxsize=512)
+def _row_type(columns: tuple[str, ...]) -> type:
+    """
+    Return the named tuple type of result rows with these columns.
+
+    Named tuples are as small as the fetched rows and give attribute access
+    to the columns of any table. Column names that are not valid identifiers
+    are renamed to `_<position>`.
+    """
+    return namedtuple("SearchRow", columns, rename=True)
+
+
+def _to_rows(rows: list[tuple], columns: list[str]) -> list[tuple]:
+    row_type = _row_type(tuple(columns))
+    return [row_type._make(row) for row in rows]
+
+
+def _is_vector_column(values: Iterable[Any]) -> bool:
+    first = next((value for value in values if value is not None), None)
+    return _is_array(first) or hasattr(first, "to_numpy")
+
+
+def _vector_matrix(values: list[Any]) -> "np.ndarray":
+    """
+    Copy the vectors of a column into one contiguous float32 2-D array.
+
+    Missing vectors become rows of NaN. halfvec and bit values are converted
+    with their `to_numpy`.
+    """
+    import numpy as np
+
+    vectors = [
+        value.to_numpy() if hasattr(value, "to_numpy") else value for value in values
+    ]
+    dim = next((len(vector) for vector in vectors if vector is not None), 0)
+    matrix = np.full((len(vectors), dim), np.nan, dtype=np.float32)
+    for i, vector in enumerate(vectors):
+        if vector is not None:
+            matrix[i] = vector
+    return matrix
+
+
+def _to_numpy(rows: list[tuple], columns: list[str]) -> "dict[str, np.ndarray]":
+    """
+    Convert fetched rows to one NumPy array per column.
+
+    Vector columns become float32 2-D arrays with one row per result.
+    """
+    import numpy as np
+
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    return {
+        name: _vector_matrix(column) if _is_vector_column(column) else np.array(column)
+        for name, column in zip(columns, values)
+    }
+
+
+def _to_arrow(rows: list[tuple], columns: list[str]) -> "pa.Table":
+    """
+    Convert fetched rows to a pyarrow Table.
+
+    Vector columns become fixed size lists of float32 backed by a single
+    contiguous buffer, with nulls for missing vectors.
+    """
+    import pyarrow as pa
+
+    values = list(zip(*rows)) if rows else [() for _ in columns]
+    arrays = []
+    for column in values:
+        if _is_vector_column(column):
+            matrix = _vector_matrix(column)
+            mask = None
+            if any(value is None for value in column):
+                mask = pa.array([value is None for value in column])
+            arrays.append(
+                pa.FixedSizeListArray.from_arrays(
+                    pa.array(matrix.ravel()), matrix.shape[1], mask=mask
+                )
+            )
+        else:
+            arrays.append(pa.array(column))
+    return pa.table(arrays, names=columns)
+
+
+def _conform_batch(
+    batch: "pa.Table | dict[str, np.ndarray]", schema: dict[str, Any]
+) -> "pa.Table | dict[str, np.ndarray]":
+    """
+    Give a columnar batch the column types seen in earlier batches.
+
+    Types are inferred from the values of each batch, so a column that is NULL
+    throughout one batch comes out as an Arrow null column or a 1-D NumPy array
+    instead of the type of the other batches. `schema` maps column names to the
+    first Arrow type or vector dimension seen, and is updated in place.
+    """
+    if isinstance(batch, dict):
+        import numpy as np
+
+        for name, array in batch.items():
+            if array.ndim == 2:
+                schema.setdefault(name, array.shape[1])
+        return {
+            name: np.full((len(array), schema[name]), np.nan, dtype=np.float32)
+            if name in schema and array.ndim == 1
+            else array
+            for name, array in batch.items()
+        }
+
+    import pyarrow as pa
+
+    for field in batch.schema:
+        if not pa.types.is_null(field.type):
+            schema.setdefault(field.name, field.type)
+    return batch.cast(
+        pa.schema(
+            (field.name, schema.get(field.name, field.type)) for field in batch.schema
+        )
+    )
+
+
+def _materialize(
+    rows: list[tuple],
+    columns: list[str],
+    return_dataframe: bool = True,
+    columnar: str | None = None,
+) -> Any:
+    """
+    Convert fetched rows to the result type requested from a search.
+    """
+    if columnar == "arrow":
+        return _to_arrow(rows, columns)
+    if columnar == "numpy":
+        return _to_numpy(rows, columns)
+    if columnar is not None:
+        raise ValueError(
+            f"Unknown columnar format {columnar!r}, use 'arrow' or 'numpy'"
+        )
+    if not return_dataframe:
+        return _to_rows(rows, columns)
+    return _to_dataframe(rows, columns)
+
+
+def _iter_dataframe_rows(df: "pd.DataFrame", chunk_size: int) -> Iterator[tuple]:
+    """
+    Yield the rows of a DataFrame as tuples, with missing values as None.
+
+    The DataFrame is converted one chunk at a time so that no full copy of it
+    is held in memory.
+    """
+    for i in range(0, len(df), chunk_size):
+        chunk = df.iloc[i : i + chunk_size].astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def _arrow_column_values(column: "pa.Array | pa.ChunkedArray") -> Iterable[Any]:
+    """
+    Convert an Arrow column to per-row Python values.
+
+    Lists of numbers with a uniform length (embeddings) become rows of a single
+    2-D NumPy array instead of Python lists, which pgvector dumps directly.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    if isinstance(column, pa.ChunkedArray):
+        column = column.combine_chunks()
+    type_ = column.type
+    if (
+        len(column)
+        and column.null_count == 0
+        and (
+            pa.types.is_list(type_)
+            or pa.types.is_large_list(type_)
+            or pa.types.is_fixed_size_list(type_)
+        )
+        and (
+            pa.types.is_floating(type_.value_type)
+            or pa.types.is_integer(type_.value_type)
+        )
+    ):
+        lengths = pc.list_value_length(column)
+        min_max = pc.min_max(lengths)
+        if min_max["min"].as_py() == min_max["max"].as_py():
+            flat = column.flatten().to_numpy(zero_copy_only=False)
+            return flat.astype("float32", copy=False).reshape(len(column), -1)
+    return column.to_pylist()
+
+
+def _iter_arrow_rows(
+    batch: "pa.RecordBatch | pa.Table", columns: list[str]
+) -> Iterator[tuple]:
+    """
+    Yield the rows of an Arrow batch as tuples of the given columns.
+    """
+    return zip(*(_arrow_column_values(batch.column(name)) for name in columns))
+
+
+def _quantize_value(value: Any, type_name: str) -> Any:
+    """
+    Convert a float vector to the pgvector value for a `halfvec` or `bit` column.
+
+    Binary quantization keeps the sign of each dimension, as pgvector's
+    `binary_quantize` does. Values of other types are returned unchanged.
+    """
+    import numpy as np
+    from pgvector.psycopg import Bit, HalfVector
+
+    if value is None or isinstance(value, (HalfVector, Bit, str)):
+        return value
+    if type_name == "halfvec":
+        return HalfVector(np.asarray(value, dtype=np.float16))
+    if type_name == "bit":
+        return Bit(np.asarray(value) > 0)
+    return value
+
+
+_INTEGER_TYPES = {"int2", "int4", "int8"}
+
+
+def _cast_integer_rows(rows: Iterable[tuple], types: list[str]) -> Iterable[tuple]:
+    """
+    Convert integral float values of integer columns to int.
+
+    A DataFrame integer column with missing values has a float dtype, and the
+    binary COPY format rejects floats for integer columns.
+    """
+    positions = [i for i, type_name in enumerate(types) if type_name in _INTEGER_TYPES]
+    if not positions:
+        return rows
+
+    def cast(row: tuple) -> tuple:
+        values = list(row)
+        for i in positions:
+            value = values[i]
+            if isinstance(value, float) and value.is_integer():
+                values[i] = int(value)
+        return tuple(values)
+
+    return map(cast, rows)
+
+
+def _quantize_rows(rows: Iterable[tuple], types: list[str]) -> Iterable[tuple]:
+    """
+    Quantize the values of the `halfvec` and `bit` columns of each row.
+    """
+    positions = [
+        i for i, type_name in enumerate(types) if type_name in _QUANTIZED_TYPES
+    ]
+    if not positions:
+        return rows
+
+    def quantize(row: tuple) -> tuple:
+        row = list(row)
+        for i in positions:
+            row[i] = _quantize_value(row[i], types[i])
+        return tuple(row)
+
+    return map(quantize, rows)
+
+
+def _quantized_columns(
+    columns: list[str],
+    quantize: dict[str, str] | None,
+    table_columns: dict[str, str],
+) -> tuple[list[str], list[str]]:
+    """
+    Add the quantized columns to derive from `quantize` to the columns to load.
+
+    Returns the table columns to write and, for each of them, the source column
+    in the data to read it from.
+    """
+    targets = list(columns)
+    sources = list(columns)
+    for target, source in (quantize or {}).items():
+        if table_columns.get(target) not in _QUANTIZED_TYPES:
+            raise ValueError(
+                f"Column '{target}' is not a halfvec or bit column of the table"
+            )
+        if target not in targets:
+            targets.append(target)
+            sources.append(source)
+    return targets, sources
+
+
+def _skip_rows(
+    batches: Iterable["pa.RecordBatch | pa.Table"], num_rows: int
+) -> Iterator["pa.RecordBatch | pa.Table"]:
+    """
+    Drop the first `num_rows` rows from a stream of Arrow batches.
+    """
+    for batch in batches:
+        if num_rows >= batch.num_rows:
+            num_rows -= batch.num_rows
+            continue
+        if num_rows:
+            batch = batch.slice(num_rows)
+            num_rows = 0
+        yield batch
+
+
+_PARTITIONS_SQL = """
+    SELECT child.relname
+    FROM pg_inherits
+    JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+    JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+    WHERE parent.relname = %s
+    ORDER BY child.relname
+"""
+
+# Partition key columns of a table; NULL for expression keys
+_PARTITION_KEY_SQL = """
+    SELECT attribute.attname
+    FROM pg_partitioned_table partitioned
+    JOIN pg_class parent ON parent.oid = partitioned.partrelid
+    CROSS JOIN LATERAL unnest(partitioned.partattrs::int2[]) AS key(attnum)
+    LEFT JOIN pg_attribute attribute
+        ON attribute.attrelid = partitioned.partrelid
+        AND attribute.attnum = key.attnum
+    WHERE parent.relname = %s
+"""
+
+_TABLE_COLUMNS_SQL = """
+    SELECT column_name, udt_name
+    FROM information_schema.columns
+    WHERE table_name = %s
+    ORDER BY ordinal_position
+"""
+
+
+def _partition_strategy(
+    values: list[Any] | None,
+    start: Any,
+    end: Any,
+    modulus: int | None,
+    remainder: int | None,
+) -> str:
+    """
+    Return the partition bounds given to `add_partition`: "list", "range",
+    "hash" or "default". Raises ValueError for incomplete or mixed bounds.
+    """
+    given = [
+        strategy
+        for strategy, arguments in (
+            ("list", (values,)),
+            ("range", (start, end)),
+            ("hash", (modulus, remainder)),
+        )
+        if any(argument is not None for argument in arguments)
+    ]
+    if len(given) > 1:
+        raise ValueError(
+            "Pass either values, start and end, or modulus and remainder, "
+            f"not bounds of {' and '.join(given)} partitions"
+        )
+    if given == ["range"] and (start is None or end is None):
+        raise ValueError("A RANGE partition needs both start and end")
+    if given == ["hash"] and (modulus is None or remainder is None):
+        raise ValueError("A HASH partition needs both modulus and remainder")
+    return given[0] if given else "default"
+
+
+def _table_columns_from_rows(rows: list[tuple]) -> dict[str, str]:
+    """
+    Build the column name to type name mapping from `_TABLE_COLUMNS_SQL` rows.
+    """
+    return {
+        (name.decode() if isinstance(name, bytes) else name): (
+            udt.decode() if isinstance(udt, bytes) else udt
+        )
+        for name, udt in rows
+    }
+
+
+def _insert_sql(table_name: str, columns: list[str]) -> str:
+    columns_str = ", ".join(columns)
+    placeholders = ", ".join(["%s"] * len(columns))
+    return f"""
+        INSERT INTO {table_name} ({columns_str})
+        VALUES ({placeholders})
+    """
+
+
+def _upsert_sql(
+    table_name: str, staging_table: str, columns: list[str], key_columns: list[str]
+) -> str:
+    """
+    Build a statement merging a staging table into a table on its key columns.
+
+    New keys are inserted and existing rows are only updated when one of their
+    values changed, so unchanged rows are not rewritten. Returns the number of
+    inserted and of updated rows.
+    """
+    columns_str = ", ".join(columns)
+    keys_str = ", ".join(key_columns)
+    values = [col for col in columns if col not in key_columns]
+    if values:
+        assignments = ", ".join(f"{col} = EXCLUDED.{col}" for col in values)
+        old = ", ".join(f"{table_name}.{col}" for col in values)
+        new = ", ".join(f"EXCLUDED.{col}" for col in values)
+        conflict = (
+            f"DO UPDATE SET {assignments} WHERE ROW({old}) IS DISTINCT FROM ROW({new})"
+        )
+    else:
+        conflict = "DO NOTHING"
+    return f"""
+        WITH merged AS (
+            INSERT INTO {table_name} ({columns_str})
+            SELECT DISTINCT ON ({keys_str}) {columns_str}
+            FROM {staging_table}
+            ORDER BY {keys_str}
+            ON CONFLICT ({keys_str}) {conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+        FROM merged
+    """
+
+
+def _copy_sql(table_name: str, columns: list[str], binary: bool) -> str:
+    return f"COPY {table_name} ({', '.join(columns)}) FROM STDIN" + (
+        " (FORMAT BINARY)" if binary else ""
+    )
+
+
+# Column types left out of search results by default
+_HIDDEN_TYPES = {"tsvector", "vector", "halfvec", "bit"}
+_QUANTIZED_TYPES = {"halfvec", "bit"}
+
+
+def _query_vector(type_name: str, param: str = "%(embedding)s") -> str:
+    """
+    Return the SQL expression comparing a float query vector with a column.
+
+    The query is converted on the server to the type of `halfvec` and `bit`
+    columns, so callers always pass a full-precision embedding.
+    """
+    if type_name == "halfvec":
+        return f"{param}::halfvec"
+    if type_name == "bit":
+        return f"binary_quantize({param})"
+    return param
+
+
+# Search statements are built from the table name, the search columns and the
+# table schema, passed as a tuple of (column name, type name) pairs. Every
+# parameter, including the LIMIT, is bound at execution time, so the statement
+# text for a given table and column never changes: it is built once, and
+# psycopg prepares it server-side once it has been run `prepare_threshold` times.
+TableColumns = tuple[tuple[str, str], ...]
+
+
+def _default_projection(
+    table_name: str, table_columns: TableColumns, projection: tuple[str, ...] = ()
+) -> str:
+    """
+    Return the select list for search results.
+
+    Selects the `projection` columns when given, and otherwise every column
+    except tsvector and vector columns, which are large and rarely needed in
+    results.
+    """
+    if projection:
+        unknown = set(projection) - dict(table_columns).keys()
+        if unknown:
+            raise ValueError(f"Unknown columns of {table_name}: {sorted(unknown)}")
+        names = projection
+    else:
+        names = [name for name, udt in table_columns if udt not in _HIDDEN_TYPES]
+    return ", ".join(f"{table_name}.{name}" for name in names)
+
+
+def _with_column(projection: tuple[str, ...], column: str) -> tuple[str, ...]:
+    """
+    Add a column the statement relies on to an explicit projection.
+    """
+    if projection and column not in projection:
+        return (column, *projection)
+    return projection
+
+
+# Search filters are passed to the statement builders as a tuple of
+# (column name, "eq" or "any") pairs, and their values as parameters, so that a
+# statement is built once per set of filtered columns.
+Filters = tuple[tuple[str, str], ...]
+
+
+def _filter_params(filters: dict[str, Any] | None) -> tuple[Filters, dict[str, Any]]:
+    """
+    Split search filters into the statement's filter key and its parameters.
+
+    A list of values matches any of them; other values must match exactly.
+    """
+    key = []
+    params = {}
+    for column, value in sorted((filters or {}).items()):
+        if isinstance(value, (list, tuple, set)) or _is_array(value):
+            key.append((column, "any"))
+            params[f"filter_{column}"] = list(value)
+        else:
+            key.append((column, "eq"))
+            params[f"filter_{column}"] = value
+    return tuple(key), params
+
+
+def _filter_conditions(table_name: str, filters: Filters) -> list[str]:
+    """
+    Return the WHERE conditions of search filters.
+
+    Filtering on a partition key lets PostgreSQL skip the other partitions.
+    """
+    return [
+        f"{table_name}.{column} = ANY(%(filter_{column})s)"
+        if op == "any"
+        else f"{table_name}.{column} = %(filter_{column})s"
+        for column, op in filters
+    ]
+
+
+def _where(conditions: list[str]) -> str:
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _fts_select(
+    table_name: str,
+    search_column: str,
+    table_columns: TableColumns,
+    config: str,
+    filters: Filters,
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Return the matching and ranking part of a full-text search statement.
+
+    Uses the stored `<search_column>_tsv` column when the table has one.
+    """
+    tsv_column = f"{search_column}_tsv"
+    if dict(table_columns).get(tsv_column) == "tsvector":
+        document = tsv_column
+    else:
+        document = f"to_tsvector('{config}', {search_column})"
+    select_columns = _default_projection(table_name, table_columns, projection)
+    return f"""
+        SELECT {select_columns},
+            parsed_query::text as parsed_query,
+            %(query)s as user_query,
+            ts_rank_cd({document}, parsed_query) as search_rank
+        FROM {table_name}, plainto_tsquery('{config}', %(query)s) parsed_query
+        {_where([f"{document} @@ parsed_query", *_filter_conditions(table_name, filters)])}
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _fts_sql(
+    table_name: str,
+    search_column: str,
+    table_columns: TableColumns,
+    config: str = "english",
+    filters: Filters = (),
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build the full-text search statement for a table.
+    """
+    select = _fts_select(
+        table_name, search_column, table_columns, config, filters, projection
+    )
+    return f"""
+        {select}
+        ORDER BY search_rank DESC
+        LIMIT %(num_results)s
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _fts_page_sql(
+    table_name: str,
+    search_column: str,
+    table_columns: TableColumns,
+    config: str = "english",
+    filters: Filters = (),
+    id_column: str = "id",
+    keyset: bool = False,
+    limit: bool = True,
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build a full-text search statement in a stable (rank, id) order.
+
+    With `keyset`, only the rows after (%(after_rank)s, %(after_id)s) in that
+    order are returned, so that a page is found without reading the pages
+    before it. Without `limit`, every match is returned, to be streamed
+    through a server-side cursor.
+    """
+    select = _fts_select(
+        table_name,
+        search_column,
+        table_columns,
+        config,
+        filters,
+        _with_column(projection, id_column),
+    )
+    # ts_rank_cd returns real, and the token holds the rank as text mode
+    # returned it, which may differ from the stored real in double precision.
+    # Casting it back to real compares it with the exact rank of the last row.
+    after = (
+        f"search_rank < %(after_rank)s::real OR (search_rank = %(after_rank)s::real "
+        f"AND {id_column} > %(after_id)s)"
+    )
+    return f"""
+        SELECT * FROM ({select}) ranked
+        {_where([f"({after})"] if keyset else [])}
+        ORDER BY search_rank DESC, {id_column}
+        {"LIMIT %(num_results)s" if limit else ""}
+    """
+
+
+# Server-side cursors need names that are unique on their connection
+_cursor_ids = itertools.count()
+
+
+def _encode_page_token(rank: float, row_id: Any) -> str:
+    """
+    Return the opaque continuation token of the last row of a page.
+    """
+    payload = json.dumps([rank, row_id], default=str).encode()
+    return base64.urlsafe_b64encode(payload).decode()
+
+
+def _decode_page_token(token: str) -> tuple[float, Any]:
+    try:
+        rank, row_id = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except Exception as e:
+        raise ValueError(f"Invalid page token: {token!r}") from e
+    return rank, row_id
+
+
+@functools.lru_cache(maxsize=512)
+def _vector_search_sql(
+    table_name: str,
+    vector_column: str,
+    table_columns: TableColumns,
+    metric: "DistanceMetric",
+    filters: Filters = (),
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build the k-nearest-neighbour statement for a vector column.
+
+    Orders directly by the distance operator so that an HNSW or IVFFlat index
+    built with the matching operator class can serve the query.
+    """
+    select_columns = _default_projection(table_name, table_columns, projection)
+    query = _query_vector(dict(table_columns).get(vector_column, "vector"))
+    distance = f"{table_name}.{vector_column} {metric.operator} {query}"
+    return f"""
+        SELECT {select_columns},
+            {distance} as distance
+        FROM {table_name}
+        {_where(_filter_conditions(table_name, filters))}
+        ORDER BY {distance}
+        LIMIT %(num_results)s
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _rerank_search_sql(
+    table_name: str,
+    vector_column: str,
+    candidate_column: str,
+    table_columns: TableColumns,
+    metric: "DistanceMetric",
+    candidate_metric: "DistanceMetric",
+    filters: Filters = (),
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build a two-stage statement: approximate candidates, then an exact re-rank.
+
+    The inner query orders by the quantized `candidate_column`, so that its
+    index serves it, and the outer query re-orders the candidates by their
+    full-precision distance.
+    """
+    select_columns = _default_projection(table_name, table_columns, projection)
+    query = _query_vector(dict(table_columns)[candidate_column])
+    candidate_distance = (
+        f"{table_name}.{candidate_column} {candidate_metric.operator} {query}"
+    )
+    return f"""
+        SELECT *
+        FROM (
+            SELECT {select_columns},
+                {candidate_distance} as candidate_distance,
+                {table_name}.{vector_column} {metric.operator} %(embedding)s as distance
+            FROM {table_name}
+            {_where(_filter_conditions(table_name, filters))}
+            ORDER BY {candidate_distance}
+            LIMIT %(candidates)s
+        ) candidates
+        ORDER BY distance
+        LIMIT %(num_results)s
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _vector_search_by_id_sql(
+    table_name: str,
+    vector_column: str,
+    id_column: str,
+    table_columns: TableColumns,
+    metric: "DistanceMetric",
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build the k-nearest-neighbour statement for the stored vector of a row.
+
+    The row's vector is looked up and searched with in a LATERAL subquery, so
+    the ANN index serves the search in the same round trip. One extra neighbour
+    is fetched to make up for the row itself, which is left out.
+    """
+    select_columns = _default_projection(
+        table_name, table_columns, _with_column(projection, id_column)
+    )
+    distance = f"{table_name}.{vector_column} {metric.operator} query.embedding"
+    return f"""
+        SELECT hits.*
+        FROM (
+            SELECT {vector_column} AS embedding
+            FROM {table_name}
+            WHERE {id_column} = %(id)s
+        ) query
+        CROSS JOIN LATERAL (
+            SELECT {select_columns},
+                {distance} as distance
+            FROM {table_name}
+            ORDER BY {distance}
+            LIMIT %(num_results)s + 1
+        ) hits
+        WHERE hits.{id_column} <> %(id)s
+        ORDER BY hits.distance
+        LIMIT %(num_results)s
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _self_knn_sql(
+    table_name: str,
+    vector_column: str,
+    id_column: str,
+    metric: "DistanceMetric",
+    keyset: bool,
+) -> str:
+    """
+    Build a statement finding the close neighbours of a batch of rows.
+
+    The batch is the next `batch_size` rows by `id_column` after `after` (or
+    the first ones without `keyset`). Every source row is returned at least
+    once, with NULLs when it has no neighbour within `max_distance`, so that
+    the caller can continue from the last source id.
+    """
+    after = f"AND {id_column} > %(after)s" if keyset else ""
+    distance = f"{table_name}.{vector_column} {metric.operator} source.embedding"
+    return f"""
+        SELECT source.{id_column} AS source_id,
+            neighbours.{id_column} AS duplicate_id,
+            neighbours.distance
+        FROM (
+            SELECT {id_column}, {vector_column} AS embedding
+            FROM {table_name}
+            WHERE {vector_column} IS NOT NULL {after}
+            ORDER BY {id_column}
+            LIMIT %(batch_size)s
+        ) source
+        LEFT JOIN LATERAL (
+            SELECT {table_name}.{id_column}, {distance} AS distance
+            FROM {table_name}
+            ORDER BY {distance}
+            LIMIT %(num_neighbors)s
+        ) neighbours
+            ON neighbours.{id_column} <> source.{id_column}
+            AND neighbours.distance <= %(max_distance)s
+        ORDER BY source.{id_column}, neighbours.distance
+    """
+
+
+def _cluster_pairs(pairs: Iterable[tuple[Any, Any]]) -> list[list[Any]]:
+    """
+    Group linked ids into clusters (connected components) with union-find.
+
+    Clusters and the ids within them are sorted.
+    """
+    parent: dict[Any, Any] = {}
+
+    def find(x: Any) -> Any:
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        root_a, root_b = find(a), find(b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    clusters: dict[Any, list[Any]] = {}
+    for x in parent:
+        clusters.setdefault(find(x), []).append(x)
+    return sorted(sorted(cluster) for cluster in clusters.values())
+
+
+@functools.lru_cache(maxsize=512)
+def _hybrid_search_sql(
+    table_name: str,
+    text_column: str,
+    vector_column: str,
+    id_column: str,
+    table_columns: TableColumns,
+    metric: "DistanceMetric",
+    config: str = "english",
+    filters: Filters = (),
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build the Reciprocal Rank Fusion statement combining both search legs.
+
+    Each leg takes its own top candidates in a subquery, so that the full-text
+    leg can use the GIN index and the vector leg the ANN index, before ranking
+    and fusing them.
+    """
+    tsv_column = f"{text_column}_tsv"
+    if dict(table_columns).get(tsv_column) == "tsvector":
+        document = f"{table_name}.{tsv_column}"
+    else:
+        document = f"to_tsvector('{config}', {table_name}.{text_column})"
+    select_columns = _default_projection(table_name, table_columns, projection)
+    query = _query_vector(dict(table_columns).get(vector_column, "vector"))
+    distance = f"{table_name}.{vector_column} {metric.operator} {query}"
+    conditions = _filter_conditions(table_name, filters)
+    text_where = _where([f"{document} @@ parsed_query", *conditions])
+    return f"""
+        WITH vector_leg AS (
+            SELECT {id_column}, RANK() OVER (ORDER BY distance) AS rank
+            FROM (
+                SELECT {table_name}.{id_column}, {distance} AS distance
+                FROM {table_name}
+                {_where(conditions)}
+                ORDER BY {distance}
+                LIMIT %(vector_candidates)s
+            ) candidates
+        ),
+        text_leg AS (
+            SELECT {id_column}, RANK() OVER (ORDER BY search_rank DESC) AS rank
+            FROM (
+                SELECT {table_name}.{id_column},
+                    ts_rank_cd({document}, parsed_query) AS search_rank
+                FROM {table_name}, plainto_tsquery('{config}', %(query)s) parsed_query
+                {text_where}
+                ORDER BY search_rank DESC
+                LIMIT %(text_candidates)s
+            ) candidates
+        ),
+        fused AS (
+            SELECT
+                COALESCE(vector_leg.{id_column}, text_leg.{id_column}) AS {id_column},
+                text_leg.rank AS text_rank,
+                vector_leg.rank AS vector_rank,
+                COALESCE(%(vector_weight)s::float8 / (%(vector_k)s + vector_leg.rank), 0.0) +
+                COALESCE(%(text_weight)s::float8 / (%(text_k)s + text_leg.rank), 0.0) AS score
+            FROM vector_leg
+            FULL OUTER JOIN text_leg ON vector_leg.{id_column} = text_leg.{id_column}
+            ORDER BY score DESC
+            LIMIT %(num_results)s
+        )
+        SELECT {select_columns},
+            fused.score,
+            fused.text_rank,
+            fused.vector_rank
+        FROM fused
+        JOIN {table_name} ON {table_name}.{id_column} = fused.{id_column}
+        ORDER BY fused.score DESC
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _fts_batch_sql(
+    table_name: str,
+    search_column: str,
+    table_columns: TableColumns,
+    config: str = "english",
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build a statement running one full-text search per element of a text array.
+    """
+    tsv_column = f"{search_column}_tsv"
+    if dict(table_columns).get(tsv_column) == "tsvector":
+        document = f"{table_name}.{tsv_column}"
+    else:
+        document = f"to_tsvector('{config}', {table_name}.{search_column})"
+    select_columns = _default_projection(table_name, table_columns, projection)
+    return f"""
+        SELECT queries.query_index, hits.*
+        FROM unnest(%(queries)s::text[]) WITH ORDINALITY AS queries(user_query, query_index)
+        CROSS JOIN LATERAL (
+            SELECT {select_columns},
+                parsed_query::text as parsed_query,
+                queries.user_query,
+                ts_rank_cd({document}, parsed_query) as search_rank
+            FROM {table_name}, plainto_tsquery('{config}', queries.user_query) parsed_query
+            WHERE {document} @@ parsed_query
+            ORDER BY search_rank DESC
+            LIMIT %(num_results)s
+        ) hits
+        ORDER BY queries.query_index, hits.search_rank DESC
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _vector_batch_sql(
+    table_name: str,
+    vector_column: str,
+    table_columns: TableColumns,
+    metric: "DistanceMetric",
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build a statement running one k-nearest-neighbour search per query vector.
+    """
+    select_columns = _default_projection(table_name, table_columns, projection)
+    query = _query_vector(
+        dict(table_columns).get(vector_column, "vector"), "queries.embedding"
+    )
+    distance = f"{table_name}.{vector_column} {metric.operator} {query}"
+    return f"""
+        SELECT queries.query_index, hits.*
+        FROM unnest(%(embeddings)s::vector[]) WITH ORDINALITY AS queries(embedding, query_index)
+        CROSS JOIN LATERAL (
+            SELECT {select_columns},
+                {distance} as distance
+            FROM {table_name}
+            ORDER BY {distance}
+            LIMIT %(num_results)s
+        ) hits
+        ORDER BY queries.query_index, hits.distance
+    """
+
+
+@functools.lru_cache(maxsize=512)
+def _export_columns(
+    table_columns: TableColumns, projection: tuple[str, ...] = ()
+) -> tuple[str, ...]:
+    """
+    Return the columns read by an export, every column but tsvectors by default.
+    """
+    return projection or tuple(name for name, udt in table_columns if udt != "tsvector")
+
+
+def _export_sql(
+    table_name: str,
+    table_columns: TableColumns,
+    filters: Filters = (),
+    projection: tuple[str, ...] = (),
+) -> str:
+    """
+    Build the statement reading the rows of a table, vector columns included.
+    """
+    projection = _export_columns(table_columns, projection)
+    return f"""
+        SELECT {_default_projection(table_name, table_columns, projection)}
+        FROM {table_name}
+        {_where(_filter_conditions(table_name, filters))}
+    """
+
+
+def _group_results(
+    columns: list[str], rows: list[tuple], num_queries: int
+) -> list["pd.DataFrame"]:
+    """
+    Split the rows of a batch search into one DataFrame per query.
+
+    Rows carry the 1-based `query_index` of their query as first column;
+    queries without any hit get an empty DataFrame.
+    """
+    df = _to_dataframe(rows, columns)
+    groups = {
+        index: group.drop(columns="query_index").reset_index(drop=True)
+        for index, group in df.groupby("query_index", sort=False)
+    }
+    empty = df.drop(columns="query_index").iloc[0:0]
+    # Every query without hits gets its own frame, safe to modify
+    return [
+        groups[i] if i in groups else empty.copy() for i in range(1, num_queries + 1)
+    ]
+
+
+# pgvector's default and maximum of hnsw.ef_search
+_DEFAULT_EF_SEARCH = 40
+_MAX_EF_SEARCH = 1000
+
+
+def _search_settings(
+    ef_search: int | None = None,
+    probes: int | None = None,
+    parallel_workers: int | None = None,
+    candidates: int | None = None,
+) -> dict[str, str]:
+    """
+    Collect the per-query index and parallel query settings that were given.
+
+    An HNSW scan returns at most `hnsw.ef_search` rows. When a query needs
+    `candidates` rows from the index and no `ef_search` is given, it is raised
+    to `candidates` so that the default does not cut the candidates short.
+    """
+    if candidates is not None:
+        if ef_search is None and candidates > _DEFAULT_EF_SEARCH:
+            ef_search = min(candidates, _MAX_EF_SEARCH)
+        if ef_search is not None and ef_search < candidates:
+            logger.warning(
+                f"ef_search={ef_search} is below candidates={candidates}, "
+                f"an HNSW index returns at most {ef_search} candidates"
+            )
+    settings = {}
+    if ef_search is not None:
+        settings["hnsw.ef_search"] = str(ef_search)
+    if probes is not None:
+        settings["ivfflat.probes"] = str(probes)
+    if parallel_workers is not None:
+        settings["max_parallel_workers_per_gather"] = str(parallel_workers)
+    return settings
+
+
+def _set_config(
+    settings: dict[str, str], is_local: bool = True
+) -> tuple[str, list[str]]:
+    """
+    Build a statement and its parameters applying `settings` with set_config().
+
+    With `is_local` the settings only last until the end of the transaction.
+    """
+    sql = "SELECT " + ", ".join(
+        f"set_config(%s, %s, {str(is_local).lower()})" for _ in settings
+    )
+    return sql, [item for setting in settings.items() for item in setting]
+
+
+def _explain_sql(sql: str) -> str:
+    """
+    Wrap a statement so that it returns its executed plan with buffer usage.
+    """
+    return f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"
 
 
 class ColumnType(Enum):
@@ -17,349 +1107,2190 @@ class ColumnType(Enum):
     TIMESTAMP = "TIMESTAMP"
     BOOLEAN = "BOOLEAN"
     VECTOR = "VECTOR"
+    HALFVEC = "HALFVEC"
+    BIT = "BIT"
+
+
+class VectorIndexMethod(Enum):
+    HNSW = "hnsw"
+    IVFFLAT = "ivfflat"
+
+
+class PartitionMethod(Enum):
+    LIST = "LIST"
+    RANGE = "RANGE"
+    HASH = "HASH"
+
+
+class DistanceMetric(Enum):
+    L2 = "l2"
+    COSINE = "cosine"
+    INNER_PRODUCT = "ip"
+    # For bit columns
+    HAMMING = "hamming"
+    JACCARD = "jaccard"
+
+    @property
+    def operator(self) -> str:
+        """The pgvector distance operator for this metric."""
+        return {
+            "l2": "<->",
+            "cosine": "<=>",
+            "ip": "<#>",
+            "hamming": "<~>",
+            "jaccard": "<%>",
+        }[self.value]
+
+    def opclass(self, type_name: str = "vector") -> str:
+        """The operator class to index a column of `type_name` with."""
+        return f"{type_name}_{self.value}_ops"
+
+
+class Column:
+    def __init__(
+        self,
+        name: str,
+        type: ColumnType,
+        default: Any | None = None,
+        vector_dim: int | None = None,
+        nullable: bool = True,
+    ):
+        self.name = name
+        self.type = type
+        self.default = default
+        self.vector_dim = vector_dim
+        self.nullable = nullable
+
+    def get_sql_definition(self) -> str:
+        if self.type in (ColumnType.VECTOR, ColumnType.HALFVEC, ColumnType.BIT):
+            if not self.vector_dim:
+                raise ValueError(
+                    "Vector dimension must be specified for vector columns"
+                )
+            type_str = f"{self.type.value.lower()}({self.vector_dim})"
+        else:
+            type_str = self.type.value
+
+        sql = f"{self.name} {type_str}"
+        if not self.nullable:
+            sql += " NOT NULL"
+        if self.default is not None:
+            if isinstance(self.default, str):
+                sql += f" DEFAULT '{self.default}'"
+            elif isinstance(self.default, (bool, int, float)):
+                sql += f" DEFAULT {self.default}"
+            elif isinstance(self.default, datetime):
+                sql += f" DEFAULT TIMESTAMP '{self.default}'"
+            else:
+                sql += f" DEFAULT {self.default}"
+        return sql
+
+
+@dataclass
+class SearchResult:
+    id: int
+    image_filepath: str
+    caption: str
+    user_query: str
+    parsed_query: str
+    search_rank: float
+    # add other relevant fields
+
+    @classmethod
+    def from_db_row(cls, row: tuple, columns: list[str]) -> "SearchResult":
+        return cls(**dict(zip(columns, row)))
+
+    @staticmethod
+    def to_dataframe(results: list["SearchResult | tuple"]) -> "pd.DataFrame":
+        """Convert SearchResults or named tuple result rows to a DataFrame"""
+        import pandas as pd
+
+        return pd.DataFrame(results)
+
+    @staticmethod
+    def to_itables(results: list["SearchResult | tuple"]) -> "pd.DataFrame":
+        """Convert a list of SearchResults or result rows to a pandas DataFrame"""
+        return SearchResult.dataframe_to_itables(SearchResult.to_dataframe(results))
+
+    @staticmethod
+    def dataframe_to_itables(df: "pd.DataFrame") -> "pd.DataFrame":
+        """
+        Prepare a results DataFrame for display: embed the images and turn the
+        file paths into links. Reads every image file, so only use it for display.
+        """
+        import base64
+        import os
+        from pathlib import Path
+
+        def get_image_data_url(filepath: str) -> str:
+            try:
+                with open(filepath, "rb") as f:
+                    data = base64.b64encode(f.read()).decode()
+                    ext = Path(filepath).suffix[1:]  # Remove the dot from extension
+                    return f"data:image/{ext};base64,{data}"
+            except Exception:
+                return ""
+
+        def get_file_link(filepath: str) -> str:
+            # Check if running in JupyterLab
+            if os.environ.get("JPY_PARENT_PID"):
+                return f'<a href="files/{filepath}" target="_blank">{filepath}</a>'
+            # VS Code or other environments
+            return f'<a href="file://{filepath}" target="_blank">{filepath}</a>'
+
+        df = df.copy()
+        # Add HTML img tag column and make filepath a clickable link
+        if "image_filepath" in df.columns:
+            df["image"] = df["image_filepath"].apply(
+                lambda x: f'<img src="{get_image_data_url(x)}" style="max-height: 150px; max-width: 300px; object-fit: contain;"/>'
+            )
+            df["image_filepath"] = df["image_filepath"].apply(get_file_link)
+        return df
+
+    @staticmethod
+    def show(df: "pd.DataFrame") -> None:
+        """Display a results DataFrame as an interactive table in a notebook"""
+        from itables import show
+
+        show(
+            SearchResult.dataframe_to_itables(df),
+            classes="display",
+            style="width:100%;margin:auto",
+            columnDefs=[{"className": "dt-left", "targets": "_all"}],
+        )
+
+
+def _configure_connection(conn: psycopg.Connection) -> None:
+    """
+    Prepare a new pooled connection. Runs once per physical connection.
+    """
+    from pgvector.psycopg import register_vector
+
+    register_vector(conn)
+    # Leave the connection idle, as required by the pool
+    conn.commit()
+
+
+class PostgreSQLDatabase:
+    """
+    A class to interact with the PostgreSQL database.
+
+    By default every `with` block opens its own connection. Pass a pool created
+    with `create_pool` to borrow a connection from the pool for each call
+    instead; the instance can then be kept around and used without `with`.
+
+    Search statements are fully parameterized, so psycopg prepares them
+    server-side once they have run `prepare_threshold` times on a connection,
+    and later calls skip parsing and planning. Set it to None to disable
+    prepared statements. With a pool, pass it to `create_pool` instead.
+
+    Search and ingest calls record per-stage timings in `metrics`; see
+    `Metrics` for callbacks and EXPLAIN capture.
+
+    Examples:
+        pool = PostgreSQLDatabase.create_pool("my_database", max_size=20)
+        db = PostgreSQLDatabase("my_database", pool=pool)
+        db.full_text_search("man in a yellow shirt", "image_metadata", "caption")
+    """
+
+    def __init__(
+        self,
+        database_name: str,
+        pool: "ConnectionPool | None" = None,
+        prepare_threshold: int | None = 5,
+        metrics: Metrics | None = None,
+    ) -> None:
+        self.database_name = database_name
+        self.pool = pool
+        self.prepare_threshold = prepare_threshold
+        self.metrics = metrics or Metrics()
+        self.conn = None
+        self.cur = None
+        self._table_columns: dict[str, dict[str, str]] = {}
+
+    def __enter__(self):
+        if self.pool is None:
+            self.connect()
+            self.setup_pgvector_extension()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.pool is None:
+            self.disconnect()
+        if exc_type:
+            logger.error(f"Error: {exc_type} - {exc_val}")
+            return False
+        return True
+
+    def connect(self):
+        try:
+            self.conn = psycopg.connect(
+                dbname=self.database_name, prepare_threshold=self.prepare_threshold
+            )
+            self.cur = self.conn.cursor()
+            logger.info("Connected to database")
+        except Exception as e:
+            logger.error(f"Error connecting to database: {e}")
+            raise
+
+    def disconnect(self):
+        try:
+            self.cur.close()
+            self.conn.close()
+            logger.info("Disconnected from database")
+        except Exception as e:
+            logger.error(f"Error disconnecting from database: {e}")
+
+    def setup_pgvector_extension(self):
+        try:
+            self.cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
+            from pgvector.psycopg import register_vector
+
+            register_vector(self.conn)
+            logger.info("pgvector extension initialized")
+        except Exception as e:
+            logger.error(f"Error creating pgvector extension: {e}")
+
+    @staticmethod
+    def create_pool(
+        database_name: str,
+        min_size: int = 1,
+        max_size: int = 10,
+        prepare_threshold: int | None = 5,
+        **kwargs,
+    ) -> "ConnectionPool":
+        """
+        Create a connection pool for the database.
+
+        The pgvector extension is created once up front, and each pooled
+        connection registers the pgvector types once when it is opened.
+        Requires the `psycopg_pool` package.
+
+        Args:
+            database_name: Name of the database to connect to
+            min_size: Number of connections kept open by the pool
+            max_size: Maximum number of connections the pool may open
+            prepare_threshold: Number of executions after which a statement is
+                prepared server-side on a connection. None disables prepared
+                statements, e.g. behind a transaction-pooling PgBouncer
+            **kwargs: Extra arguments passed to `psycopg_pool.ConnectionPool`
+
+        Returns:
+            An open `psycopg_pool.ConnectionPool`. Close it when done.
+        """
+        from psycopg_pool import ConnectionPool
+
+        try:
+            with psycopg.connect(dbname=database_name, autocommit=True) as conn:
+                conn.execute("CREATE EXTENSION IF NOT EXISTS vector")
+
+            pool = ConnectionPool(
+                kwargs={
+                    "dbname": database_name,
+                    "prepare_threshold": prepare_threshold,
+                },
+                min_size=min_size,
+                max_size=max_size,
+                configure=_configure_connection,
+                open=True,
+                **kwargs,
+            )
+            logger.info(
+                f"Created connection pool for '{database_name}' "
+                f"(min_size={min_size}, max_size={max_size})"
+            )
+            return pool
+        except Exception as e:
+            logger.error(f"Error creating connection pool: {e}")
+            raise
+
+    @contextmanager
+    def _cursor(self) -> Iterator[psycopg.Cursor]:
+        """
+        Yield a cursor for a single call.
+
+        In pooled mode a connection is borrowed from the pool for the duration
+        of the block and returned afterwards; otherwise the cursor of the
+        connection opened by `connect` is used.
+        """
+        if self.pool is None:
+            if self.cur is None:
+                raise RuntimeError("Not connected. Use 'with' or call connect first.")
+            yield self.cur
+        else:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                yield cur
+
+    @contextmanager
+    def _stream_cursor(self) -> Iterator[psycopg.Cursor]:
+        """
+        Yield a cursor on a connection of its own, for server-side cursors.
+
+        A server-side cursor only lives until its transaction ends, so it
+        cannot share the connection opened by `connect`: any call committing
+        on that connection while the stream is consumed would close it. In
+        pooled mode, a connection is borrowed from the pool as usual.
+        """
+        if self.pool is not None:
+            with self.pool.connection() as conn, conn.cursor() as cur:
+                yield cur
+        else:
+            with psycopg.connect(
+                dbname=self.database_name, prepare_threshold=self.prepare_threshold
+            ) as conn:
+                _configure_connection(conn)
+                with conn.cursor() as cur:
+                    yield cur
+
+    def initialize_table(
+        self,
+        table_name: str,
+        id_column: str = "id",
+        drop_existing: bool = True,
+        partition_by: Column | None = None,
+        partition_method: PartitionMethod = PartitionMethod.LIST,
+    ):
+        """
+        Initialize a new table with just an ID column.
+
+        With `partition_by`, the table is partitioned on that column, which is
+        created with the table and becomes part of the primary key. Rows can
+        only be inserted once a matching partition exists, see `add_partition`
+        and `create_hash_partitions`. Partitioning on e.g. the source dataset or
+        the ingest date keeps vacuum and index builds per partition, and lets
+        searches filtered on the column skip the other partitions.
+
+        Args:
+            table_name: Name of the table to create
+            id_column: Name of the ID column (defaults to 'id')
+            drop_existing: Drop the table if it exists. Set to False to keep an
+                existing table and its rows, e.g. to refresh it with
+                `upsert_dataframe`
+            partition_by: Partition key column
+            partition_method: PartitionMethod.LIST, RANGE or HASH
+
+        Examples:
+            db.initialize_table(
+                "image_metadata",
+                partition_by=Column("source", ColumnType.TEXT),
+            )
+            db.add_partition("image_metadata", "image_metadata_coco", values=["coco"])
+        """
+        if partition_by is None:
+            definition = f"{id_column} SERIAL PRIMARY KEY"
+            partitioning = ""
+        else:
+            definition = (
+                f"{id_column} SERIAL, {partition_by.get_sql_definition()}, "
+                f"PRIMARY KEY ({id_column}, {partition_by.name})"
+            )
+            partitioning = (
+                f"PARTITION BY {partition_method.value} ({partition_by.name})"
+            )
+
+        try:
+            self.table_name = table_name  # Store table name for future operations
+            with self._cursor() as cur:
+                if drop_existing:
+                    cur.execute(f"DROP TABLE IF EXISTS {table_name}")
+                cur.execute(f"""
+                CREATE TABLE IF NOT EXISTS {table_name} (
+                    {definition}
+                ) {partitioning}
+                """)
+                cur.connection.commit()
+            self._table_columns.pop(table_name, None)
+            logger.info(
+                f"Initialized table '{table_name}' with ID column '{id_column}'"
+            )
+        except Exception as e:
+            logger.error(f"Error initializing table: {e}")
+            raise
+
+    def add_partition(
+        self,
+        table_name: str,
+        partition_name: str,
+        values: list[Any] | None = None,
+        start: Any = None,
+        end: Any = None,
+        modulus: int | None = None,
+        remainder: int | None = None,
+    ) -> str:
+        """
+        Create a partition of a partitioned table.
+
+        Pass `values` for a LIST partition, `start` and `end` (exclusive) for a
+        RANGE partition, `modulus` and `remainder` for a HASH partition, or
+        nothing for the default partition. Incomplete or mixed bounds raise a
+        ValueError. Indexes of the table are created on the new partition
+        automatically.
+
+        Returns:
+            Name of the partition
+
+        Examples:
+            db.add_partition("image_metadata", "image_metadata_coco", values=["coco"])
+            db.add_partition(
+                "image_metadata", "image_metadata_2024",
+                start="2024-01-01", end="2025-01-01",
+            )
+        """
+        strategy = _partition_strategy(values, start, end, modulus, remainder)
+        try:
+            with self._cursor() as cur:
+
+                def literals(items):
+                    return ", ".join(
+                        psycopg.sql.Literal(v).as_string(cur) for v in items
+                    )
+
+                if strategy == "list":
+                    bounds = f"FOR VALUES IN ({literals(values)})"
+                elif strategy == "range":
+                    bounds = (
+                        f"FOR VALUES FROM ({literals([start])}) TO ({literals([end])})"
+                    )
+                elif strategy == "hash":
+                    bounds = (
+                        f"FOR VALUES WITH (MODULUS {int(modulus)}, "
+                        f"REMAINDER {int(remainder)})"
+                    )
+                else:
+                    bounds = "DEFAULT"
+                cur.execute(
+                    f"CREATE TABLE IF NOT EXISTS {partition_name} "
+                    f"PARTITION OF {table_name} {bounds}"
+                )
+                cur.connection.commit()
+            logger.info(f"Created partition '{partition_name}' of {table_name}")
+            return partition_name
+        except Exception as e:
+            logger.error(f"Error creating partition: {e}")
+            raise
+
+    def create_hash_partitions(self, table_name: str, num_partitions: int) -> list[str]:
+        """
+        Split a HASH-partitioned table into `num_partitions` partitions.
+
+        Returns:
+            Names of the partitions, `<table_name>_p<i>`
+        """
+        return [
+            self.add_partition(
+                table_name,
+                f"{table_name}_p{i}",
+                modulus=num_partitions,
+                remainder=i,
+            )
+            for i in range(num_partitions)
+        ]
+
+    def list_partitions(self, table_name: str) -> list[str]:
+        """
+        Return the names of the partitions of a table, empty if not partitioned.
+        """
+        with self._cursor() as cur:
+            return self._get_partitions(cur, table_name)
+
+    def _get_partitions(self, cur: psycopg.Cursor, table_name: str) -> list[str]:
+        cur.execute(_PARTITIONS_SQL, (table_name,))
+        return [
+            name.decode() if isinstance(name, bytes) else name
+            for (name,) in cur.fetchall()
+        ]
+
+    def _get_partition_key(self, cur: psycopg.Cursor, table_name: str) -> list[str]:
+        """
+        Return the partition key columns of a table, empty if not partitioned.
+        """
+        cur.execute(_PARTITION_KEY_SQL, (table_name,))
+        names = [
+            name.decode() if isinstance(name, bytes) else name
+            for (name,) in cur.fetchall()
+        ]
+        if None in names:
+            raise ValueError(
+                f"Table {table_name} is partitioned on an expression, "
+                "which a unique key cannot include"
+            )
+        return names
+
+    def add_column(
+        self,
+        name: str,
+        type: ColumnType,
+        default: Any | None = None,
+        vector_dim: int | None = None,
+        nullable: bool = True,
+    ):
+        """
+        Add a single column to the table.
+
+        Examples:
+            db.add_column("source", ColumnType.TEXT, default="unknown")
+            db.add_column("confidence", ColumnType.FLOAT, default=1.0)
+            db.add_column("embedding", ColumnType.VECTOR, vector_dim=512)
+            db.add_column("embedding_half", ColumnType.HALFVEC, vector_dim=512)
+            db.add_column("embedding_bit", ColumnType.BIT, vector_dim=512)
+        """
+        self.add_columns(Column(name, type, default, vector_dim, nullable))
+
+    def add_columns(self, *columns: Column | tuple[str, ColumnType]):
+        """
+        Add multiple columns to the table.
+
+        Examples:
+            db.add_columns(
+                Column("source", ColumnType.TEXT, default="unknown"),
+                Column("confidence", ColumnType.FLOAT, default=1.0),
+                Column("embedding", ColumnType.VECTOR, vector_dim=512),
+                ("simple_column", ColumnType.TEXT)  # Simple tuple syntax
+            )
+        """
+        if not hasattr(self, "table_name"):
+            raise RuntimeError("Table not initialized. Call initialize_table first.")
 
+        try:
+            with self._cursor() as cur:
+                for col in columns:
+                    if isinstance(col, tuple):
+                        col = Column(col[0], col[1])
 
-class Column:
-    def __init__(
+                    alter_sql = f"ALTER TABLE {self.table_name} ADD COLUMN IF NOT EXISTS {col.get_sql_definition()}"
+                    cur.execute(alter_sql)
+
+                cur.connection.commit()
+            self._table_columns.pop(self.table_name, None)
+            logger.info(
+                f"Added {len(columns)} new columns [{', '.join([col.name for col in columns])}] to {self.table_name}"
+            )
+        except Exception as e:
+            logger.error(f"Error adding columns: {e}")
+            raise
+
+    def create_fts_index(
+        self, table_name: str, search_column: str, config: str = "english"
+    ) -> str:
+        """
+        Add a stored tsvector column for a text column and index it with GIN.
+
+        The generated column is named `<search_column>_tsv` and is kept up to date
+        by PostgreSQL on every insert and update. `full_text_search` picks it up
+        automatically, so queries hit the index and rank on the precomputed vector
+        instead of re-parsing every row.
+
+        Args:
+            table_name: Name of the table containing the text column
+            search_column: Text column to index
+            config: Text search configuration used to build the tsvector
+
+        Returns:
+            Name of the generated tsvector column
+
+        Examples:
+            db.create_fts_index("image_metadata", "caption")
+        """
+        tsv_column = f"{search_column}_tsv"
+        index_name = f"{table_name}_{tsv_column}_idx"
+        try:
+            with self._cursor() as cur:
+                cur.execute(f"""
+                ALTER TABLE {table_name}
+                ADD COLUMN IF NOT EXISTS {tsv_column} tsvector
+                GENERATED ALWAYS AS (to_tsvector('{config}', coalesce({search_column}, ''))) STORED;
+
+                CREATE INDEX IF NOT EXISTS {index_name}
+                ON {table_name} USING GIN ({tsv_column})
+                """)
+                cur.connection.commit()
+            self._table_columns.pop(table_name, None)
+            logger.info(
+                f"Created full-text index '{index_name}' on {table_name}.{tsv_column}"
+            )
+            return tsv_column
+        except Exception as e:
+            logger.error(f"Error creating full-text index: {e}")
+            raise
+
+    def create_vector_index(
         self,
-        name: str,
-        type: ColumnType,
-        default: Any | None = None,
-        vector_dim: int | None = None,
-        nullable: bool = True,
+        table_name: str,
+        vector_column: str,
+        method: VectorIndexMethod = VectorIndexMethod.HNSW,
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        m: int = 16,
+        ef_construction: int = 64,
+        lists: int = 100,
+        maintenance_work_mem: str | None = None,
+        max_parallel_workers: int | None = None,
+        concurrently: bool = False,
+    ) -> str:
+        """
+        Create an approximate nearest neighbour index on a vector column.
+
+        The index only serves queries that use the same metric, so pass the same
+        `metric` to `vector_search`. IVFFlat indexes should be built after the
+        data has been loaded, since the lists are computed from existing rows.
+
+        Args:
+            table_name: Name of the table containing the vector column
+            vector_column: Vector column to index
+            method: VectorIndexMethod.HNSW or VectorIndexMethod.IVFFLAT
+            metric: Distance metric, selects the operator class
+            m: HNSW max connections per layer
+            ef_construction: HNSW size of the candidate list during the build
+            lists: IVFFlat number of inverted lists
+            maintenance_work_mem: Memory for the build (e.g. "2GB"). The build is
+                much faster when the graph fits in it
+            max_parallel_workers: Parallel maintenance workers for the build
+            concurrently: Build without locking out writes. Slower
+
+        On a partitioned table, the index of each partition is built and
+        committed separately, then attached to the table's index. Each build
+        only needs memory for its own partition, and with `concurrently` the
+        partitions stay writable. Partitions added later get the index
+        automatically.
+
+        Returns:
+            Name of the created index
+
+        Examples:
+            db.create_vector_index("image_metadata", "img_emb")
+            db.create_vector_index(
+                "image_metadata", "img_emb",
+                method=VectorIndexMethod.IVFFLAT, lists=200,
+            )
+        """
+        index_name = f"{table_name}_{vector_column}_{method.value}_idx"
+        if method == VectorIndexMethod.HNSW:
+            params = f"m = {m}, ef_construction = {ef_construction}"
+        else:
+            params = f"lists = {lists}"
+
+        settings = {}
+        if maintenance_work_mem is not None:
+            settings["maintenance_work_mem"] = maintenance_work_mem
+        if max_parallel_workers is not None:
+            settings["max_parallel_maintenance_workers"] = str(max_parallel_workers)
+
+        try:
+            with self._cursor() as cur:
+                conn = cur.connection
+                type_name = self._get_table_columns(cur, table_name)[vector_column]
+                index_type = (
+                    f"USING {method.value} "
+                    f"({vector_column} {metric.opclass(type_name)}) WITH ({params})"
+                )
+                create = "CREATE INDEX CONCURRENTLY" if concurrently else "CREATE INDEX"
+                partitions = self._get_partitions(cur, table_name)
+                if partitions:
+                    statements = [
+                        (
+                            f"CREATE INDEX IF NOT EXISTS {index_name} "
+                            f"ON ONLY {table_name} {index_type}"
+                        )
+                    ]
+                    for partition in partitions:
+                        partition_index = (
+                            f"{partition}_{vector_column}_{method.value}_idx"
+                        )
+                        statements.append(
+                            f"{create} IF NOT EXISTS {partition_index} "
+                            f"ON {partition} {index_type}"
+                        )
+                        statements.append(
+                            f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index}"
+                        )
+                else:
+                    statements = [
+                        (
+                            f"{create} IF NOT EXISTS {index_name} "
+                            f"ON {table_name} {index_type}"
+                        )
+                    ]
+
+                start = time.perf_counter()
+                if concurrently:
+                    # CREATE INDEX CONCURRENTLY cannot run inside a transaction,
+                    # so the settings are applied to the session and reset after,
+                    # also when the build fails, before the connection is reused
+                    conn.commit()
+                    conn.autocommit = True
+                    try:
+                        if settings:
+                            cur.execute(*_set_config(settings, is_local=False))
+                        for statement in statements:
+                            cur.execute(statement)
+                    finally:
+                        try:
+                            for name in settings:
+                                cur.execute(f"RESET {name}")
+                        finally:
+                            conn.autocommit = False
+                else:
+                    for statement in statements:
+                        if settings:
+                            cur.execute(*_set_config(settings))
+                        cur.execute(statement)
+                        conn.commit()
+
+            logger.info(
+                f"Created {method.value} index '{index_name}' on "
+                f"{table_name}.{vector_column} in {time.perf_counter() - start:.2f}s"
+            )
+            return index_name
+        except Exception as e:
+            logger.error(f"Error creating vector index: {e}")
+            raise
+
+    def insert_dataframe(
+        self,
+        df: "pd.DataFrame",
+        batch_size: int = 1000,
+        method: str = "insert",
+        commit_every: int | None = None,
+        binary: bool = True,
+        quantize: dict[str, str] | None = None,
     ):
-        self.name = name
-        self.type = type
-        self.default = default
-        self.vector_dim = vector_dim
-        self.nullable = nullable
+        """
+        Insert data from a pandas DataFrame into the table.
+        Automatically matches DataFrame columns with table columns.
 
-    def get_sql_definition(self) -> str:
-        if self.type == ColumnType.VECTOR:
-            if not self.vector_dim:
-                raise ValueError(
-                    "Vector dimension must be specified for vector columns"
+        Float vectors inserted into `halfvec` or `bit` columns are quantized on
+        the fly, and `quantize` fills such columns from another vector column,
+        so that a quantized copy of an embedding can be stored next to it.
+
+        Args:
+            df: pandas DataFrame containing the data
+            batch_size: Number of rows to insert in each batch (default: 1000)
+            method: "insert" for batched INSERT statements or "copy" to stream
+                the rows through COPY, which is much faster for large loads
+            commit_every: With method="copy", commit after this many rows.
+                None loads everything in a single transaction
+            binary: With method="copy", use the binary COPY format. Set to False
+                to let PostgreSQL parse text input instead
+            quantize: Mapping of halfvec or bit table columns to the DataFrame
+                column to quantize into them
+
+        Examples:
+            db.insert_dataframe(df)
+            db.insert_dataframe(df, method="copy")
+            db.insert_dataframe(df, method="copy", commit_every=100_000)
+            db.insert_dataframe(df, method="copy", quantize={"img_emb_bit": "img_emb"})
+        """
+        if not hasattr(self, "table_name"):
+            raise RuntimeError("Table not initialized. Call initialize_table first.")
+        if method not in ("insert", "copy"):
+            raise ValueError(
+                f"Unknown insert method '{method}', use 'insert' or 'copy'"
+            )
+
+        try:
+            with (
+                self.metrics.operation("insert_dataframe") as timings,
+                self._cursor() as cur,
+            ):
+                # Get existing table columns and their types
+                table_columns = self._get_table_columns(cur, self.table_name)
+
+                # Filter DataFrame to only include columns that exist in the table
+                valid_columns = [col for col in df.columns if col in table_columns]
+                logger.info(f"Table columns: {table_columns}")
+                logger.info(f"DataFrame columns: {df.columns}")
+                logger.info(f"Valid columns to insert: {valid_columns}")
+                if not valid_columns:
+                    raise ValueError(
+                        "No matching columns found between DataFrame and table"
+                    )
+
+                columns, sources = _quantized_columns(
+                    valid_columns, quantize, table_columns
                 )
-            type_str = f"vector({self.vector_dim})"
+                df_filtered = df[sources].set_axis(columns, axis=1)
+                types = [table_columns[col] for col in columns]
+                start = time.perf_counter()
+
+                if method == "copy":
+                    with timings.stage("write"):
+                        total_rows = self._copy_rows(
+                            cur,
+                            self.table_name,
+                            columns,
+                            _quantize_rows(
+                                _iter_dataframe_rows(df_filtered, batch_size), types
+                            ),
+                            types=types,
+                            binary=binary,
+                            commit_every=commit_every,
+                        )
+                else:
+                    # Prepare the insert statement
+                    insert_sql = _insert_sql(self.table_name, columns)
+
+                    # Convert DataFrame to list of tuples
+                    with timings.stage("materialize"):
+                        data = list(_quantize_rows(df_filtered.values.tolist(), types))
+
+                    # Insert data in batches
+                    total_rows = len(data)
+                    for i in range(0, total_rows, batch_size):
+                        batch = data[i : i + batch_size]
+                        with timings.stage("write"):
+                            cur.executemany(insert_sql, batch)
+                            cur.connection.commit()
+                        logger.info(
+                            f"Inserted batch {i//batch_size + 1} ({min(i + batch_size, total_rows)}/{total_rows} rows)"
+                        )
+                timings.rows = total_rows
+
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Successfully inserted {total_rows} rows into {self.table_name} "
+                f"in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/s, method={method})"
+            )
+
+            # Log any columns that were in DataFrame but not in table
+            skipped_columns = set(df.columns) - set(valid_columns)
+            if skipped_columns:
+                logger.warning(f"Skipped columns not in table: {skipped_columns}")
+
+        except Exception as e:
+            logger.error(f"Error inserting data: {e}")
+            raise
+
+    def insert_arrow(
+        self,
+        data: "pa.Table | Iterable[pa.RecordBatch | pa.Table] | Any",
+        batch_size: int = 10_000,
+        start_row: int = 0,
+        binary: bool = True,
+        quantize: dict[str, str] | None = None,
+    ) -> int:
+        """
+        Stream Arrow data into the table with COPY, one batch at a time.
+
+        Memory use is bounded by the batch size: no pandas DataFrame or full
+        copy of the data is built. Each batch is committed once written, and
+        `self.last_committed_row` records how far the load got, so a failed
+        load can be resumed by passing that value as `start_row`.
+
+        Args:
+            data: A `pyarrow.Table`, an iterable of Arrow record batches or
+                tables, or a `HuggingFaceDatasets` instance
+            batch_size: Number of rows per batch and per commit, for tables
+                and datasets
+            start_row: Number of leading rows to skip, to resume a load
+            binary: Use the binary COPY format
+            quantize: Mapping of halfvec or bit table columns to the Arrow
+                column to quantize into them, as in `insert_dataframe`
+
+        Returns:
+            Number of rows inserted
+
+        Examples:
+            ds = HuggingFaceDatasets("UCSC-VLAA/Recap-COCO-30K")
+            db.insert_arrow(ds)
+            db.insert_arrow(ds, start_row=db.last_committed_row)  # resume
+        """
+        import pyarrow as pa
+
+        if not hasattr(self, "table_name"):
+            raise RuntimeError("Table not initialized. Call initialize_table first.")
+
+        if hasattr(data, "iter_arrow_batches"):
+            batches = data.iter_arrow_batches(batch_size=batch_size, offset=start_row)
+        elif isinstance(data, pa.Table):
+            batches = data.slice(start_row).to_batches(max_chunksize=batch_size)
         else:
-            type_str = self.type.value
+            batches = _skip_rows(data, start_row)
 
-        sql = f"{self.name} {type_str}"
-        if not self.nullable:
-            sql += " NOT NULL"
-        if self.default is not None:
-            if isinstance(self.default, str):
-                sql += f" DEFAULT '{self.default}'"
-            elif isinstance(self.default, (bool, int, float)):
-                sql += f" DEFAULT {self.default}"
-            elif isinstance(self.default, datetime):
-                sql += f" DEFAULT TIMESTAMP '{self.default}'"
-            else:
-                sql += f" DEFAULT {self.default}"
-        return sql
+        self.last_committed_row = start_row
+        total_rows = 0
+        start = time.perf_counter()
+        try:
+            with (
+                self.metrics.operation("insert_arrow") as timings,
+                self._cursor() as cur,
+            ):
+                table_columns = self._get_table_columns(cur, self.table_name)
+                for batch in batches:
+                    valid_columns = [
+                        col for col in batch.schema.names if col in table_columns
+                    ]
+                    if not valid_columns:
+                        raise ValueError(
+                            "No matching columns found between Arrow data and table"
+                        )
+                    columns, sources = _quantized_columns(
+                        valid_columns, quantize, table_columns
+                    )
+                    types = [table_columns[col] for col in columns]
+                    with timings.stage("write"):
+                        total_rows += self._copy_rows(
+                            cur,
+                            self.table_name,
+                            columns,
+                            _quantize_rows(_iter_arrow_rows(batch, sources), types),
+                            types=types,
+                            binary=binary,
+                        )
+                    timings.rows = total_rows
+                    self.last_committed_row = start_row + total_rows
+                    logger.info(f"Committed rows up to {self.last_committed_row}")
 
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"Successfully inserted {total_rows} rows into {self.table_name} "
+                f"in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):.0f} rows/s, method=arrow)"
+            )
+            return total_rows
+        except Exception as e:
+            logger.error(
+                f"Error inserting Arrow data: {e}. "
+                f"Resume with start_row={self.last_committed_row}"
+            )
+            raise
 
-@dataclass
-class SearchResult:
-    id: int
-    image_filepath: str
-    caption: str
-    user_query: str
-    parsed_query: str
-    search_rank: float
-    # add other relevant fields
+    def upsert_dataframe(
+        self,
+        df: "pd.DataFrame",
+        key_columns: str | list[str],
+        batch_size: int = 1000,
+        binary: bool = True,
+        quantize: dict[str, str] | None = None,
+    ) -> tuple[int, int]:
+        """
+        Insert new rows and update changed rows of the table, matched on a key.
 
-    @classmethod
-    def from_db_row(cls, row: tuple, columns: list[str]) -> "SearchResult":
-        return cls(**dict(zip(columns, row)))
+        The rows are copied into a temporary staging table and merged with
+        `INSERT ... ON CONFLICT` in a single transaction. Rows whose values are
+        all unchanged are left alone, so refreshing a table with a new version
+        of a dataset only writes the difference. Rows missing from `df` are
+        kept. A unique index on `key_columns` is created if needed.
 
-    @staticmethod
-    def to_dataframe(results: list["SearchResult"]) -> pd.DataFrame:
-        return pd.DataFrame([vars(result) for result in results])
+        On a partitioned table, PostgreSQL only allows unique indexes that
+        include the partition key, so the partition key columns are added to
+        `key_columns` and must be in `df`. Rows are then matched within their
+        partition.
 
-    @staticmethod
-    def to_itables(results: list["SearchResult"]) -> pd.DataFrame:
-        """Convert a list of SearchResults to a pandas DataFrame"""
-        import base64
-        import os
-        from pathlib import Path
+        Columns of the table that are not in `df`, such as embeddings computed
+        separately, keep their values on update.
 
-        def get_image_data_url(filepath: str) -> str:
-            try:
-                with open(filepath, "rb") as f:
-                    data = base64.b64encode(f.read()).decode()
-                    ext = Path(filepath).suffix[1:]  # Remove the dot from extension
-                    return f"data:image/{ext};base64,{data}"
-            except Exception:
-                return ""
+        Args:
+            df: pandas DataFrame containing the data, including the key columns
+            key_columns: Natural key of the rows, e.g. "image_id" or a column
+                holding a hash of the row's content
+            batch_size: Number of rows converted at a time
+            binary: Use the binary COPY format
+            quantize: Mapping of halfvec or bit table columns to the DataFrame
+                column to quantize into them, as in `insert_dataframe`
 
-        def get_file_link(filepath: str) -> str:
-            # Check if running in JupyterLab
-            if os.environ.get("JPY_PARENT_PID"):
-                return f'<a href="files/{filepath}" target="_blank">{filepath}</a>'
-            # VS Code or other environments
-            return f'<a href="file://{filepath}" target="_blank">{filepath}</a>'
+        Returns:
+            Number of inserted rows and number of updated rows
 
-        df = pd.DataFrame([vars(result) for result in results])
-        # Add HTML img tag column and make filepath a clickable link
-        if "image_filepath" in df.columns:
-            df["image"] = df["image_filepath"].apply(
-                lambda x: f'<img src="{get_image_data_url(x)}" style="max-height: 150px; max-width: 300px; object-fit: contain;"/>'
+        Examples:
+            db.initialize_table("image_metadata", drop_existing=False)
+            db.add_columns(Column("image_id", ColumnType.INTEGER), ...)
+            inserted, updated = db.upsert_dataframe(df, "image_id")
+        """
+        if not hasattr(self, "table_name"):
+            raise RuntimeError("Table not initialized. Call initialize_table first.")
+        if isinstance(key_columns, str):
+            key_columns = [key_columns]
+
+        staging_table = f"{self.table_name}_staging"
+        try:
+            with (
+                self.metrics.operation("upsert_dataframe") as timings,
+                self._cursor() as cur,
+            ):
+                key_columns = list(key_columns) + [
+                    col
+                    for col in self._get_partition_key(cur, self.table_name)
+                    if col not in key_columns
+                ]
+                index_name = f"{self.table_name}_{'_'.join(key_columns)}_key"
+                table_columns = self._get_table_columns(cur, self.table_name)
+                valid_columns = [col for col in df.columns if col in table_columns]
+                missing_keys = set(key_columns) - set(valid_columns)
+                if missing_keys:
+                    raise ValueError(
+                        f"Key columns {missing_keys} missing from DataFrame or table"
+                    )
+                columns, sources = _quantized_columns(
+                    valid_columns, quantize, table_columns
+                )
+                types = [table_columns[col] for col in columns]
+
+                cur.execute(
+                    f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} "
+                    f"ON {self.table_name} ({', '.join(key_columns)})"
+                )
+                cur.execute(f"""
+                    CREATE TEMP TABLE {staging_table} AS
+                    SELECT {", ".join(columns)} FROM {self.table_name}
+                    WITH NO DATA
+                """)
+                with timings.stage("write"):
+                    total_rows = self._copy_rows(
+                        cur,
+                        staging_table,
+                        columns,
+                        _quantize_rows(
+                            _iter_dataframe_rows(
+                                df[sources].set_axis(columns, axis=1), batch_size
+                            ),
+                            types,
+                        ),
+                        types=types,
+                        binary=binary,
+                        commit=False,
+                    )
+                with timings.stage("merge"):
+                    cur.execute(
+                        _upsert_sql(
+                            self.table_name, staging_table, columns, key_columns
+                        )
+                    )
+                    inserted, updated = cur.fetchone()
+                    cur.execute(f"DROP TABLE {staging_table}")
+                    cur.connection.commit()
+                timings.rows = inserted + updated
+
+            logger.info(
+                f"Upserted {total_rows} rows into {self.table_name}: "
+                f"{inserted} inserted, {updated} updated, "
+                f"{total_rows - inserted - updated} unchanged"
             )
-            df["image_filepath"] = df["image_filepath"].apply(get_file_link)
-        return df
+            return inserted, updated
+
+        except Exception as e:
+            logger.error(f"Error upserting data: {e}")
+            raise
+
+    def _copy_rows(
+        self,
+        cur: psycopg.Cursor,
+        table_name: str,
+        columns: list[str],
+        rows: Iterable[tuple],
+        types: list[str],
+        binary: bool = True,
+        commit_every: int | None = None,
+        commit: bool = True,
+    ) -> int:
+        """
+        Stream rows into a table with COPY and return the number of rows written.
+
+        `types` names the PostgreSQL type of each column (e.g. "text", "vector").
+        Whole floats sent to integer columns are converted to int, since both
+        COPY formats reject floats there. With `binary` the rows are sent in the
+        binary COPY format, otherwise PostgreSQL parses their text form.
+        A new COPY is started after every `commit_every` rows so that the load
+        can be committed in chunks. With `commit=False` the transaction is left
+        open for the caller.
+        """
+        copy_sql = _copy_sql(table_name, columns, binary)
+        rows = iter(_cast_integer_rows(rows, types))
+        total_rows = 0
+        while True:
+            written = 0
+            with cur.copy(copy_sql) as copy:
+                if binary:
+                    copy.set_types(types)
+                for row in itertools.islice(rows, commit_every):
+                    copy.write_row(row)
+                    written += 1
+            total_rows += written
+            if commit_every is None or written < commit_every:
+                break
+            cur.connection.commit()
+            logger.info(f"Copied {total_rows} rows into {table_name}")
+        if commit:
+            cur.connection.commit()
+        return total_rows
+
+    def _get_table_columns(
+        self, cur: psycopg.Cursor, table_name: str
+    ) -> dict[str, str]:
+        """
+        Return the columns of a table mapped to their PostgreSQL type names.
+
+        Results are cached per table and invalidated whenever this instance
+        changes the table schema.
+        """
+        if table_name not in self._table_columns:
+            cur.execute(_TABLE_COLUMNS_SQL, (table_name,))
+            self._table_columns[table_name] = _table_columns_from_rows(cur.fetchall())
+        return self._table_columns[table_name]
+
+    def full_text_search(
+        self,
+        query: str,
+        table_name: str,
+        search_column: str,
+        num_results: int = 10,
+        config: str = "english",
+        return_dataframe: bool = True,
+        display: bool = False,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
+        """
+        Perform a full-text search on the table.
+
+        If the column was indexed with `create_fts_index`, the stored tsvector
+        column and its GIN index are used. Otherwise the tsvector is computed
+        on the fly for every row.
+
+        By default nothing is rendered and no image files are read, which is
+        what a service wants. Pass `display=True` in a notebook to show the
+        results as an interactive table with the images inlined.
+
+        Args:
+            query: Search query string
+            table_name: Name of the table to search
+            search_column: Column to perform the search on
+            num_results: Maximum number of results to return
+            config: Text search configuration, must match the one used to index
+            return_dataframe: If True, returns results as pandas DataFrame
+            display: If True, also render the results with itables
+            filters: Column values to match, e.g. {"source": "coco"} or
+                {"source": ["coco", "flickr"]}. Filtering on the partition key
+                of a partitioned table only searches the matching partitions
+            parallel_workers: Parallel workers per query, to scan several
+                partitions at once (PostgreSQL default: 2)
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
+
+        Returns:
+            Either pd.DataFrame or a list of named tuples depending on
+            return_dataframe parameter
+        """
+        filter_key, filter_params = _filter_params(filters)
+        settings = _search_settings(parallel_workers=parallel_workers)
+        try:
+            with self.metrics.operation("full_text_search") as timings:
+                with self._cursor() as cur:
+                    sql = _fts_sql(
+                        table_name,
+                        search_column,
+                        tuple(self._get_table_columns(cur, table_name).items()),
+                        config,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur,
+                        sql,
+                        {"query": query, "num_results": num_results, **filter_params},
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
+
+                with timings.stage("materialize"):
+                    output = _materialize(results, columns, return_dataframe, columnar)
+
+                if display:
+                    with timings.stage("render"):
+                        SearchResult.show(_to_dataframe(results, columns))
+
+            return output
+
+        except Exception as e:
+            logger.error(f"Error performing text search: {e}")
+            raise
+
+    def full_text_search_page(
+        self,
+        query: str,
+        table_name: str,
+        search_column: str,
+        page_size: int = 10,
+        page_token: str | None = None,
+        config: str = "english",
+        return_dataframe: bool = True,
+        filters: dict[str, Any] | None = None,
+        id_column: str = "id",
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+    ) -> "tuple[pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray], str | None]":
+        """
+        Return one page of full-text search results and the token of the next.
+
+        Results are ordered by rank, then by `id_column`, and each page starts
+        right after the last row of the previous one, so deep pages cost about
+        as much as the first instead of reading and discarding every row
+        before them. Rows inserted or updated between calls may be skipped or
+        repeated. Pass the same query, filters and config with every token.
+
+        Args:
+            query: Search query string
+            table_name: Name of the table to search
+            search_column: Column to perform the search on
+            page_size: Maximum number of results per page, at least 1
+            page_token: Token returned with the previous page, None for the first
+            config: Text search configuration, must match the one used to index
+            return_dataframe: If True, returns results as pandas DataFrame
+            filters: Column values to match, see `full_text_search`
+            id_column: Unique column breaking ties between equally ranked rows
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
 
+        Returns:
+            The page of results and the token of the next page, or None if this
+            is the last page
 
-class PostgreSQLDatabase:
-    """
-    A class to interact with the PostgreSQL database.
-    """
+        Examples:
+            page, token = db.full_text_search_page("dog", "image_metadata", "caption")
+            while token is not None:
+                page, token = db.full_text_search_page(
+                    "dog", "image_metadata", "caption", page_token=token
+                )
+        """
+        if page_size < 1:
+            raise ValueError(f"page_size must be at least 1, got {page_size}")
+        filter_key, filter_params = _filter_params(filters)
+        params = {"query": query, "num_results": page_size, **filter_params}
+        if page_token is not None:
+            params["after_rank"], params["after_id"] = _decode_page_token(page_token)
+        try:
+            with self.metrics.operation("full_text_search_page") as timings:
+                with self._cursor() as cur:
+                    sql = _fts_page_sql(
+                        table_name,
+                        search_column,
+                        tuple(self._get_table_columns(cur, table_name).items()),
+                        config,
+                        filter_key,
+                        id_column,
+                        keyset=page_token is not None,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur, sql, params, timings, binary=columnar is not None
+                    )
 
-    def __init__(self, database_name: str) -> None:
-        self.database_name = database_name
-        self.conn = None
-        self.cur = None
+                next_token = None
+                if len(results) == page_size:
+                    last = dict(zip(columns, results[-1]))
+                    next_token = _encode_page_token(
+                        last["search_rank"], last[id_column]
+                    )
 
-    def __enter__(self):
-        self.connect()
-        self.setup_pgvector_extension()
-        return self
+                with timings.stage("materialize"):
+                    output = _materialize(results, columns, return_dataframe, columnar)
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.disconnect()
-        if exc_type:
-            logger.error(f"Error: {exc_type} - {exc_val}")
-            return False
-        return True
+            return output, next_token
 
-    def connect(self):
-        try:
-            self.conn = psycopg.connect(dbname=self.database_name)
-            self.cur = self.conn.cursor()
-            logger.info("Connected to database")
         except Exception as e:
-            logger.error(f"Error connecting to database: {e}")
+            logger.error(f"Error performing paged text search: {e}")
             raise
 
-    def disconnect(self):
-        try:
-            self.cur.close()
-            self.conn.close()
-            logger.info("Disconnected from database")
-        except Exception as e:
-            logger.error(f"Error disconnecting from database: {e}")
+    def iter_full_text_search(
+        self,
+        query: str,
+        table_name: str,
+        search_column: str,
+        itersize: int = 2000,
+        config: str = "english",
+        return_dataframe: bool = True,
+        filters: dict[str, Any] | None = None,
+        id_column: str = "id",
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+    ) -> "Iterator[pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]]":
+        """
+        Stream every full-text search match in batches of `itersize` rows.
 
-    def setup_pgvector_extension(self):
+        The statement runs once behind a named server-side cursor and rows are
+        fetched `itersize` at a time, so exporting all matches of a broad
+        query needs memory for one batch only. The cursor keeps a transaction
+        open on a connection of its own until the iterator is exhausted or
+        closed, so other calls can be made while iterating. The operation's
+        timings are reported when the iterator ends and do not absorb the
+        calls made in between.
+
+        Args:
+            query: Search query string
+            table_name: Name of the table to search
+            search_column: Column to perform the search on
+            itersize: Number of rows fetched per round trip and per batch
+            config: Text search configuration, must match the one used to index
+            return_dataframe: If True, yields pandas DataFrames
+            filters: Column values to match, see `full_text_search`
+            id_column: Unique column breaking ties between equally ranked rows
+            parallel_workers: Parallel workers for the query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to yield pyarrow Tables or "numpy" to yield dicts
+                of NumPy arrays, fetched in binary
+
+        Yields:
+            Batches of results, ordered by rank and then by `id_column`
+
+        Examples:
+            for batch in db.iter_full_text_search("dog", "image_metadata", "caption"):
+                batch.to_parquet(...)
+        """
+        filter_key, filter_params = _filter_params(filters)
+        settings = _search_settings(parallel_workers=parallel_workers)
         try:
-            self.cur.execute("CREATE EXTENSION IF NOT EXISTS vector")
-            register_vector(self.conn)
-            logger.info("pgvector extension initialized")
+            with (
+                self.metrics.operation(
+                    "iter_full_text_search", detached=True
+                ) as timings,
+                self._stream_cursor() as cur,
+            ):
+                sql = _fts_page_sql(
+                    table_name,
+                    search_column,
+                    tuple(self._get_table_columns(cur, table_name).items()),
+                    config,
+                    filter_key,
+                    id_column,
+                    limit=False,
+                    projection=tuple(projection or ()),
+                )
+                batches = self._iter_server_cursor(
+                    cur,
+                    sql,
+                    {"query": query, **filter_params},
+                    itersize,
+                    timings,
+                    settings,
+                    binary=columnar is not None,
+                )
+                # Close the cursor before the connection goes back to a pool
+                with closing(batches):
+                    for columns, results in batches:
+                        with timings.stage("materialize"):
+                            batch = _materialize(
+                                results, columns, return_dataframe, columnar
+                            )
+                        yield batch
+
         except Exception as e:
-            logger.error(f"Error creating pgvector extension: {e}")
+            logger.error(f"Error streaming text search: {e}")
+            raise
 
-    def initialize_table(self, table_name: str, id_column: str = "id"):
+    def vector_search(
+        self,
+        query_embedding: "np.ndarray | list[float]",
+        table_name: str,
+        vector_column: str,
+        num_results: int = 10,
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        ef_search: int | None = None,
+        probes: int | None = None,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
         """
-        Initialize a new table with just an ID column.
+        Find the rows whose vectors are closest to a query embedding.
+
+        Uses an HNSW or IVFFlat index on the column when one exists for the
+        same metric; otherwise PostgreSQL falls back to an exact scan.
 
         Args:
-            table_name: Name of the table to create
-            id_column: Name of the ID column (defaults to 'id')
+            query_embedding: Query vector, e.g. from `CLIP.encode_text`
+            table_name: Name of the table to search
+            vector_column: Vector column to search
+            num_results: Maximum number of results to return
+            metric: Distance metric, must match the index to use it
+            ef_search: HNSW candidate list size for this query. Higher values
+                trade speed for recall (pgvector default: 40)
+            probes: IVFFlat number of lists to visit for this query
+                (pgvector default: 1)
+            filters: Column values to match, e.g. {"source": "coco"} or
+                {"source": ["coco", "flickr"]}. Filtering on the partition key
+                of a partitioned table only searches the matching partitions
+            parallel_workers: Parallel workers per query, to scan several
+                partitions at once (PostgreSQL default: 2)
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
+            return_dataframe: If False, returns a list of named tuples instead
+                of a pandas DataFrame
+
+        Returns:
+            pd.DataFrame with the matching rows and their distance, vector
+            columns excluded
         """
+        filter_key, params = _filter_params(filters)
+        settings = _search_settings(ef_search, probes, parallel_workers)
+        params = {
+            **params,
+            "embedding": _float32_vector(query_embedding),
+            "num_results": num_results,
+        }
         try:
-            self.table_name = table_name  # Store table name for future operations
-            self.cur.execute(f"""
-            DROP TABLE IF EXISTS {table_name};
+            with self.metrics.operation("vector_search") as timings:
+                with self._cursor() as cur:
+                    sql = _vector_search_sql(
+                        table_name,
+                        vector_column,
+                        tuple(self._get_table_columns(cur, table_name).items()),
+                        metric,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur,
+                        sql,
+                        params,
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
+
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
 
-            CREATE TABLE {table_name} (
-                {id_column} SERIAL PRIMARY KEY
-            )
-            """)
-            self.conn.commit()
-            logger.info(
-                f"Initialized table '{table_name}' with ID column '{id_column}'"
-            )
         except Exception as e:
-            logger.error(f"Error initializing table: {e}")
+            logger.error(f"Error performing vector search: {e}")
             raise
 
-    def add_column(
+    def vector_search_rerank(
         self,
-        name: str,
-        type: ColumnType,
-        default: Any | None = None,
-        vector_dim: int | None = None,
-        nullable: bool = True,
-    ):
+        query_embedding: "np.ndarray | list[float]",
+        table_name: str,
+        vector_column: str,
+        candidate_column: str,
+        num_results: int = 10,
+        candidates: int = 100,
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        candidate_metric: DistanceMetric | None = None,
+        ef_search: int | None = None,
+        probes: int | None = None,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
         """
-        Add a single column to the table.
+        Search a quantized column for candidates and re-rank them exactly.
 
-        Examples:
-            db.add_column("source", ColumnType.TEXT, default="unknown")
-            db.add_column("confidence", ColumnType.FLOAT, default=1.0)
-            db.add_column("embedding", ColumnType.VECTOR, vector_dim=512)
-        """
-        self.add_columns(Column(name, type, default, vector_dim, nullable))
+        `candidate_column` is a `halfvec` or `bit` copy of `vector_column`
+        (see the `quantize` argument of `insert_dataframe`). Only the index on
+        the quantized column needs to fit in memory; the full-precision vectors
+        are read for the `candidates` rows alone. Recall approaches that of an
+        exact search as `candidates` grows.
 
-    def add_columns(self, *columns: Column | tuple[str, ColumnType]):
-        """
-        Add multiple columns to the table.
+        Args:
+            query_embedding: Full-precision query vector. It is quantized on
+                the server for the candidate search
+            table_name: Name of the table to search
+            vector_column: Full-precision vector column used to re-rank
+            candidate_column: Quantized column searched for candidates
+            num_results: Maximum number of results to return
+            candidates: Number of candidates fetched from the quantized column
+            metric: Distance metric of the re-rank
+            candidate_metric: Distance metric of the candidate search, must match
+                its index. Defaults to HAMMING for bit columns and `metric`
+                otherwise
+            ef_search: HNSW candidate list size. Defaults to `candidates`, since
+                an HNSW scan returns at most `ef_search` rows (capped at
+                pgvector's maximum of 1000)
+            probes: IVFFlat number of lists to visit
+            filters: Column values to match, as in `vector_search`
+            parallel_workers: Parallel workers per query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
+            return_dataframe: If False, returns a list of named tuples instead
+                of a pandas DataFrame
+
+        Returns:
+            pd.DataFrame with the matching rows, their `candidate_distance` and
+            their full-precision `distance`, vector columns excluded
 
         Examples:
-            db.add_columns(
-                Column("source", ColumnType.TEXT, default="unknown"),
-                Column("confidence", ColumnType.FLOAT, default=1.0),
-                Column("embedding", ColumnType.VECTOR, vector_dim=512),
-                ("simple_column", ColumnType.TEXT)  # Simple tuple syntax
+            db.add_columns(Column("img_emb_bit", ColumnType.BIT, vector_dim=512))
+            db.insert_dataframe(df, method="copy", quantize={"img_emb_bit": "img_emb"})
+            db.create_vector_index(
+                "image_metadata", "img_emb_bit", metric=DistanceMetric.HAMMING
+            )
+            db.vector_search_rerank(
+                embedding, "image_metadata", "img_emb", "img_emb_bit", candidates=200
             )
         """
-        if not hasattr(self, "table_name"):
-            raise RuntimeError("Table not initialized. Call initialize_table first.")
-
+        filter_key, params = _filter_params(filters)
+        settings = _search_settings(ef_search, probes, parallel_workers, candidates)
+        params = {
+            **params,
+            "embedding": _float32_vector(query_embedding),
+            "num_results": num_results,
+            "candidates": candidates,
+        }
         try:
-            for col in columns:
-                if isinstance(col, tuple):
-                    col = Column(col[0], col[1])
+            with self.metrics.operation("vector_search_rerank") as timings:
+                with self._cursor() as cur:
+                    table_columns = self._get_table_columns(cur, table_name)
+                    if candidate_metric is None:
+                        candidate_metric = (
+                            DistanceMetric.HAMMING
+                            if table_columns[candidate_column] == "bit"
+                            else metric
+                        )
+                    sql = _rerank_search_sql(
+                        table_name,
+                        vector_column,
+                        candidate_column,
+                        tuple(table_columns.items()),
+                        metric,
+                        candidate_metric,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur,
+                        sql,
+                        params,
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
 
-                alter_sql = f"ALTER TABLE {self.table_name} ADD COLUMN {col.get_sql_definition()}"
-                self.cur.execute(alter_sql)
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
 
-            self.conn.commit()
-            logger.info(
-                f"Added {len(columns)} new columns [{', '.join([col.name for col in columns])}] to {self.table_name}"
-            )
         except Exception as e:
-            logger.error(f"Error adding columns: {e}")
+            logger.error(f"Error performing re-ranked vector search: {e}")
             raise
 
-    def insert_dataframe(self, df: pd.DataFrame, batch_size: int = 1000):
+    def vector_search_by_id(
+        self,
+        row_id: Any,
+        table_name: str,
+        vector_column: str,
+        num_results: int = 10,
+        id_column: str = "id",
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        ef_search: int | None = None,
+        probes: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
         """
-        Insert data from a pandas DataFrame into the table.
-        Automatically matches DataFrame columns with table columns.
+        Find the rows closest to a stored row, e.g. images similar to an image.
+
+        The query vector is read from the row in the same statement, so it is
+        never sent to the client. The row itself is not part of the results.
 
         Args:
-            df: pandas DataFrame containing the data
-            batch_size: Number of rows to insert in each batch (default: 1000)
-        """
-        if not hasattr(self, "table_name"):
-            raise RuntimeError("Table not initialized. Call initialize_table first.")
+            row_id: Value of `id_column` of the query row
+            table_name: Name of the table to search
+            vector_column: Vector column to search
+            num_results: Maximum number of results to return
+            id_column: Unique column identifying the row
+            metric: Distance metric, must match the index to use it
+            ef_search: HNSW candidate list size for this query
+            probes: IVFFlat number of lists to visit for this query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
+            return_dataframe: If False, returns a list of named tuples instead
+                of a pandas DataFrame
 
+        Returns:
+            pd.DataFrame with the matching rows and their distance, vector
+            columns excluded. Empty if the row does not exist
+        """
+        settings = _search_settings(ef_search, probes)
+        params = {"id": row_id, "num_results": num_results}
         try:
-            # Get existing table columns and their types
-            self.cur.execute(f"""
-                SELECT column_name, data_type 
-                FROM information_schema.columns 
-                WHERE table_name = '{self.table_name}'
-            """)
-            table_columns = {
-                row[0].decode() if isinstance(row[0], bytes) else row[0]: row[
-                    1
-                ].decode()
-                if isinstance(row[1], bytes)
-                else row[1]
-                for row in self.cur.fetchall()
-            }
-
-            # Filter DataFrame to only include columns that exist in the table
-            valid_columns = [col for col in df.columns if col in table_columns]
-            logger.info(f"Table columns: {table_columns}")
-            logger.info(f"DataFrame columns: {df.columns}")
-            logger.info(f"Valid columns to insert: {valid_columns}")
-            if not valid_columns:
-                raise ValueError(
-                    "No matching columns found between DataFrame and table"
-                )
+            with self.metrics.operation("vector_search_by_id") as timings:
+                with self._cursor() as cur:
+                    sql = _vector_search_by_id_sql(
+                        table_name,
+                        vector_column,
+                        id_column,
+                        tuple(self._get_table_columns(cur, table_name).items()),
+                        metric,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur,
+                        sql,
+                        params,
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
 
-            df_filtered = df[valid_columns]
-
-            # Prepare the insert statement
-            columns_str = ", ".join(valid_columns)
-            placeholders = ", ".join(["%s"] * len(valid_columns))
-            insert_sql = f"""
-                INSERT INTO {self.table_name} ({columns_str})
-                VALUES ({placeholders})
-            """
-
-            # Convert DataFrame to list of tuples
-            data = df_filtered.values.tolist()
-
-            # Insert data in batches
-            total_rows = len(data)
-            for i in range(0, total_rows, batch_size):
-                batch = data[i : i + batch_size]
-                self.cur.executemany(insert_sql, batch)
-                self.conn.commit()
-                logger.info(
-                    f"Inserted batch {i//batch_size + 1} ({min(i + batch_size, total_rows)}/{total_rows} rows)"
-                )
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
 
-            logger.info(
-                f"Successfully inserted {total_rows} rows into {self.table_name}"
-            )
+        except Exception as e:
+            logger.error(f"Error performing vector search by id: {e}")
+            raise
 
-            # Log any columns that were in DataFrame but not in table
-            skipped_columns = set(df.columns) - set(valid_columns)
-            if skipped_columns:
-                logger.warning(f"Skipped columns not in table: {skipped_columns}")
+    def search_hybrid(
+        self,
+        query: str,
+        query_embedding: "np.ndarray | list[float]",
+        table_name: str,
+        text_column: str,
+        vector_column: str,
+        num_results: int = 10,
+        text_candidates: int = 40,
+        vector_candidates: int = 40,
+        text_weight: float = 1.0,
+        vector_weight: float = 1.0,
+        text_k: int = 60,
+        vector_k: int = 60,
+        id_column: str = "id",
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        config: str = "english",
+        ef_search: int | None = None,
+        probes: int | None = None,
+        filters: dict[str, Any] | None = None,
+        parallel_workers: int | None = None,
+        projection: list[str] | None = None,
+        columnar: str | None = None,
+        return_dataframe: bool = True,
+    ) -> "pd.DataFrame | list[tuple] | pa.Table | dict[str, np.ndarray]":
+        """
+        Combine full-text and vector search with Reciprocal Rank Fusion (RRF).
+
+        Both legs run in a single statement and round trip. Each leg fetches its
+        own number of candidates, and every candidate scores
+        `weight / (k + rank)` for each leg it appears in. The top `num_results`
+        by total score are returned. Uses the stored tsvector column and vector
+        index when they exist.
+
+        Args:
+            query: Search query string for the full-text leg
+            query_embedding: Query vector for the vector leg, e.g. from
+                `CLIP.encode_text(query)`
+            table_name: Name of the table to search
+            text_column: Column for the full-text leg
+            vector_column: Vector column for the vector leg
+            num_results: Number of fused results to return
+            text_candidates: Number of candidates fetched by the full-text leg
+            vector_candidates: Number of candidates fetched by the vector leg
+            text_weight: RRF weight of the full-text leg
+            vector_weight: RRF weight of the vector leg
+            text_k: RRF k constant of the full-text leg
+            vector_k: RRF k constant of the vector leg
+            id_column: Unique column used to join the two legs
+            metric: Distance metric of the vector leg
+            config: Text search configuration, must match the one used to index
+            ef_search: HNSW candidate list size for this query
+            probes: IVFFlat number of lists to visit for this query
+            filters: Column values to match, as in `vector_search`
+            parallel_workers: Parallel workers per query
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
+            columnar: "arrow" to return a pyarrow Table or "numpy" to return a
+                dict of NumPy arrays, fetched in binary. Vector columns become
+                float32 2-D arrays
+            return_dataframe: If False, returns a list of named tuples instead
+                of a pandas DataFrame
+
+        Returns:
+            pd.DataFrame with the matching rows, their fused `score`, and their
+            `text_rank` and `vector_rank` (None when a leg did not return the row)
+        """
+        filter_key, params = _filter_params(filters)
+        settings = _search_settings(ef_search, probes, parallel_workers)
+        params = {
+            **params,
+            "query": query,
+            "embedding": _float32_vector(query_embedding),
+            "num_results": num_results,
+            "text_candidates": text_candidates,
+            "vector_candidates": vector_candidates,
+            "text_weight": text_weight,
+            "vector_weight": vector_weight,
+            "text_k": text_k,
+            "vector_k": vector_k,
+        }
+        try:
+            with self.metrics.operation("search_hybrid") as timings:
+                with self._cursor() as cur:
+                    sql = _hybrid_search_sql(
+                        table_name,
+                        text_column,
+                        vector_column,
+                        id_column,
+                        tuple(self._get_table_columns(cur, table_name).items()),
+                        metric,
+                        config,
+                        filter_key,
+                        projection=tuple(projection or ()),
+                    )
+                    columns, results = self._run_search(
+                        cur,
+                        sql,
+                        params,
+                        timings,
+                        settings,
+                        binary=columnar is not None,
+                    )
+
+                with timings.stage("materialize"):
+                    return _materialize(results, columns, return_dataframe, columnar)
 
         except Exception as e:
-            logger.error(f"Error inserting data: {e}")
+            logger.error(f"Error performing hybrid search: {e}")
             raise
 
-    def full_text_search(
+    def full_text_search_batch(
         self,
-        query: str,
+        queries: list[str],
         table_name: str,
         search_column: str,
         num_results: int = 10,
-    ) -> pd.DataFrame:
+        config: str = "english",
+        batch_size: int = 1000,
+        projection: list[str] | None = None,
+    ) -> list["pd.DataFrame"]:
         """
-        Perform a full-text search on the table.
+        Run many full-text searches with one statement per `batch_size` queries.
+
+        The queries are sent as a single array parameter and each one is matched
+        with a LATERAL top-k subquery. This saves a network round trip and a
+        plan per query compared to calling `full_text_search` in a loop.
 
         Args:
-            query: Search query string
+            queries: Search query strings
             table_name: Name of the table to search
             search_column: Column to perform the search on
-            num_results: Maximum number of results to return
-            return_dataframe: If True, returns results as pandas DataFrame
+            num_results: Maximum number of results per query
+            config: Text search configuration, must match the one used to index
+            batch_size: Number of queries sent per statement
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
 
         Returns:
-            Either List[SearchResult] or pd.DataFrame depending on return_dataframe parameter
+            One pd.DataFrame per query, in the order of `queries`, with the same
+            columns as `full_text_search`
         """
         try:
-            self.cur.execute(
-                f"""
-                    SELECT *,
-                        %(query)s as user_query,
-                        ts_rank_cd(to_tsvector('english', {search_column}), parsed_query) as search_rank
-                    FROM {table_name}, plainto_tsquery('english', %(query)s) parsed_query
-                    WHERE to_tsvector('english', {search_column}) @@ parsed_query
-                    ORDER BY search_rank DESC
-                    LIMIT {num_results}
-                """,
-                {"query": query},
-            )
+            results = []
+            with (
+                self.metrics.operation("full_text_search_batch") as timings,
+                self._cursor() as cur,
+            ):
+                sql = _fts_batch_sql(
+                    table_name,
+                    search_column,
+                    tuple(self._get_table_columns(cur, table_name).items()),
+                    config,
+                    projection=tuple(projection or ()),
+                )
+                for i in range(0, len(queries), batch_size):
+                    batch = list(queries[i : i + batch_size])
+                    columns, rows = self._run_search(
+                        cur,
+                        sql,
+                        {"queries": batch, "num_results": num_results},
+                        timings,
+                    )
+                    with timings.stage("materialize"):
+                        results.extend(_group_results(columns, rows, len(batch)))
+
+            return results
+
+        except Exception as e:
+            logger.error(f"Error performing batch text search: {e}")
+            raise
 
-            # Get column names from cursor description
-            columns = [desc[0] for desc in self.cur.description]
-            results = self.cur.fetchall()
+    def vector_search_batch(
+        self,
+        query_embeddings: "np.ndarray | list[np.ndarray]",
+        table_name: str,
+        vector_column: str,
+        num_results: int = 10,
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        ef_search: int | None = None,
+        probes: int | None = None,
+        batch_size: int = 1000,
+        projection: list[str] | None = None,
+    ) -> list["pd.DataFrame"]:
+        """
+        Run many vector searches with one statement per `batch_size` queries.
 
-            results = [SearchResult.from_db_row(row, columns) for row in results]
+        The query vectors are sent as a single vector array parameter and each
+        one is searched with a LATERAL top-k subquery, which can use the ANN
+        index on the column.
 
-            df = SearchResult.to_itables(results)
+        Args:
+            query_embeddings: Array of shape (num_queries, dim), or a list of
+                query vectors, e.g. from `CLIP.encode_texts`
+            table_name: Name of the table to search
+            vector_column: Vector column to search
+            num_results: Maximum number of results per query
+            metric: Distance metric, must match the index to use it
+            ef_search: HNSW candidate list size for each query
+            probes: IVFFlat number of lists to visit for each query
+            batch_size: Number of queries sent per statement
+            projection: Columns to return. Defaults to every column except
+                tsvector and vector columns
 
-            show(
-                df,
-                classes="display",
-                style="width:100%;margin:auto",
-                columnDefs=[{"className": "dt-left", "targets": "_all"}],
-            )
+        Returns:
+            One pd.DataFrame per query, in the order of `query_embeddings`, with
+            the same columns as `vector_search`
+        """
+        settings = _search_settings(ef_search, probes)
+        embeddings = [_float32_vector(emb) for emb in query_embeddings]
+        try:
+            results = []
+            with (
+                self.metrics.operation("vector_search_batch") as timings,
+                self._cursor() as cur,
+            ):
+                sql = _vector_batch_sql(
+                    table_name,
+                    vector_column,
+                    tuple(self._get_table_columns(cur, table_name).items()),
+                    metric,
+                    projection=tuple(projection or ()),
+                )
+                for i in range(0, len(embeddings), batch_size):
+                    batch = embeddings[i : i + batch_size]
+                    columns, rows = self._run_search(
+                        cur,
+                        sql,
+                        {"embeddings": batch, "num_results": num_results},
+                        timings,
+                        settings,
+                    )
+                    with timings.stage("materialize"):
+                        results.extend(_group_results(columns, rows, len(batch)))
 
-            return SearchResult.to_dataframe(results)
+            return results
 
         except Exception as e:
-            logger.error(f"Error performing text search: {e}")
+            logger.error(f"Error performing batch vector search: {e}")
+            raise
+
+    def iter_near_duplicate_pairs(
+        self,
+        table_name: str,
+        vector_column: str,
+        max_distance: float = 0.05,
+        num_neighbors: int = 10,
+        id_column: str = "id",
+        metric: DistanceMetric = DistanceMetric.COSINE,
+        batch_size: int = 1000,
+        ef_search: int | None = None,
+        probes: int | None = None,
+    ) -> Iterator[tuple[Any, Any, float]]:
+        """
+        Stream the pairs of rows whose vectors are within `max_distance`.
+
+        Runs an index-backed k-nearest-neighbour search for every row of the
+        table, `batch_size` rows per statement, paging through the table by
+        `id_column`. With an HNSW or IVFFlat index this scales with the number
+        of rows instead of the number of pairs. Only the `num_neighbors`
+        closest rows of each row are considered.
+
+        Args:
+            table_name: Name of the table to scan
+            vector_column: Vector column to compare
+            max_distance: Largest distance of a duplicate. With the cosine
+                metric, 0.05 means a cosine similarity of at least 0.95
+            num_neighbors: Neighbours searched per row
+            id_column: Unique, orderable column identifying rows
+            metric: Distance metric, must match the index to use it
+            batch_size: Number of rows searched per statement
+            ef_search: HNSW candidate list size, at least `num_neighbors`
+            probes: IVFFlat number of lists to visit
+
+        Yields:
+            (source id, duplicate id, distance) tuples. A pair usually appears
+            twice, once from each side
+        """
+        settings = _search_settings(ef_search, probes)
+        params = {
+            "batch_size": batch_size,
+            "num_neighbors": num_neighbors + 1,
+            "max_distance": max_distance,
+        }
+        try:
+            with (
+                self.metrics.operation("near_duplicates", detached=True) as timings,
+                self._cursor() as cur,
+            ):
+                after = None
+                while True:
+                    sql = _self_knn_sql(
+                        table_name,
+                        vector_column,
+                        id_column,
+                        metric,
+                        keyset=after is not None,
+                    )
+                    _, rows = self._run_search(
+                        cur, sql, {**params, "after": after}, timings, settings
+                    )
+                    for source_id, duplicate_id, distance in rows:
+                        if duplicate_id is not None:
+                            yield source_id, duplicate_id, distance
+                    if not rows:
+                        break
+                    after = rows[-1][0]
+                    num_sources = len({row[0] for row in rows})
+                    logger.info(f"Searched near duplicates up to {after}")
+                    if num_sources < batch_size:
+                        break
+
+        except Exception as e:
+            logger.error(f"Error finding near duplicates: {e}")
+            raise
+
+    def find_near_duplicates(
+        self,
+        table_name: str,
+        vector_column: str,
+        max_distance: float = 0.05,
+        **kwargs,
+    ) -> list[list[Any]]:
+        """
+        Group the rows of a table into clusters of near duplicates.
+
+        Rows are linked when one is among the other's nearest neighbours within
+        `max_distance`, and linked rows form a cluster even if not every pair
+        in it is that close. Takes the arguments of `iter_near_duplicate_pairs`.
+        Only the ids of rows with duplicates are held in memory.
+
+        Returns:
+            Clusters of ids, each with at least two rows
+
+        Examples:
+            db.create_vector_index("image_metadata", "img_emb")
+            clusters = db.find_near_duplicates("image_metadata", "img_emb", 0.02)
+        """
+        pairs = self.iter_near_duplicate_pairs(
+            table_name, vector_column, max_distance, **kwargs
+        )
+        clusters = _cluster_pairs((source, dup) for source, dup, _ in pairs)
+        logger.info(f"Found {len(clusters)} clusters of near duplicates")
+        return clusters
+
+    def iter_table(
+        self,
+        table_name: str,
+        columnar: str = "arrow",
+        batch_size: int = 50000,
+        projection: list[str] | None = None,
+        filters: dict[str, Any] | None = None,
+    ) -> "Iterator[pa.Table | dict[str, np.ndarray]]":
+        """
+        Stream the rows of a table as columnar batches of `batch_size` rows.
+
+        Rows are read through a server-side cursor in binary format, and every
+        batch is converted column by column, so an export needs memory for one
+        batch of Python values only. Vector columns arrive as float32 2-D
+        arrays, ready for re-ranking or analytics on whole columns. As with
+        `iter_full_text_search`, the cursor runs on a connection of its own.
+
+        Args:
+            table_name: Name of the table to read
+            columnar: "arrow" to yield pyarrow Tables or "numpy" to yield dicts
+                of NumPy arrays
+            batch_size: Number of rows fetched and converted at a time
+            projection: Columns to read. Defaults to every column except
+                tsvector columns
+            filters: Column values to match, as in `vector_search`
+
+        Every batch has the column types of the first non-null values seen, so
+        a column that is NULL throughout a later batch keeps its type. A table
+        without matching rows yields a single empty batch.
+
+        Yields:
+            Batches of rows, in no particular order
+        """
+        filter_key, params = _filter_params(filters)
+        try:
+            with (
+                self.metrics.operation("export", detached=True) as timings,
+                self._stream_cursor() as cur,
+            ):
+                table_columns = tuple(self._get_table_columns(cur, table_name).items())
+                sql = _export_sql(
+                    table_name,
+                    table_columns,
+                    filter_key,
+                    projection=tuple(projection or ()),
+                )
+                batches = self._iter_server_cursor(
+                    cur, sql, params, batch_size, timings, binary=True
+                )
+                schema = {}
+                empty = True
+                with closing(batches):
+                    for columns, results in batches:
+                        with timings.stage("materialize"):
+                            batch = _conform_batch(
+                                _materialize(results, columns, columnar=columnar),
+                                schema,
+                            )
+                        empty = False
+                        yield batch
+                if empty:
+                    columns = _export_columns(table_columns, tuple(projection or ()))
+                    yield _materialize([], list(columns), columnar=columnar)
+
+        except Exception as e:
+            logger.error(f"Error exporting table: {e}")
             raise
 
+    def export_table(
+        self, table_name: str, columnar: str = "arrow", **kwargs
+    ) -> "pa.Table | dict[str, np.ndarray]":
+        """
+        Read a whole table into a pyarrow Table or a dict of NumPy arrays.
+
+        Takes the arguments of `iter_table` and concatenates its batches, with
+        the column types of the first non-null values of the whole table.
+
+        Examples:
+            arrays = db.export_table("image_metadata", "numpy", projection=["id", "img_emb"])
+            arrays["img_emb"].shape  # (num_rows, 512), float32
+        """
+        batches = list(self.iter_table(table_name, columnar, **kwargs))
+        # Batches read before the first non-null value of a column lack its type
+        schema = {}
+        for batch in batches:
+            _conform_batch(batch, schema)
+        batches = [_conform_batch(batch, schema) for batch in batches]
+        if columnar == "arrow":
+            import pyarrow as pa
+
+            return pa.concat_tables(batches)
+        import numpy as np
+
+        return {
+            name: np.concatenate([batch[name] for batch in batches])
+            for name in batches[0]
+        }
+
+    def _run_search(
+        self,
+        cur: psycopg.Cursor,
+        sql: str,
+        params: dict[str, Any],
+        timings: OperationTimings,
+        settings: dict[str, str] | None = None,
+        binary: bool = False,
+    ) -> tuple[list[str], list[tuple]]:
+        """
+        Execute a search statement and return its column names and rows.
+
+        Per-query settings are sent together with the statement in a single
+        round trip and only last for the transaction, which is then committed.
+        In that case the "execute" stage also covers fetching the rows. With
+        `binary`, results are transferred in binary format, which saves parsing
+        vectors and numbers from text.
+
+        With `metrics.explain`, the statement is first run through EXPLAIN
+        ANALYZE with the same settings and parameters and the plan is appended
+        to `timings.explain`.
+        """
+        if settings:
+            with cur.connection.pipeline():
+                cur.execute(*_set_config(settings))
+                if self.metrics.explain:
+                    self._explain(cur, sql, params, timings)
+                with timings.stage("execute"):
+                    cur.execute(sql, params, binary=binary)
+                    results = cur.fetchall()
+            cur.connection.commit()
+        else:
+            if self.metrics.explain:
+                self._explain(cur, sql, params, timings)
+            with timings.stage("execute"):
+                cur.execute(sql, params, binary=binary)
+            with timings.stage("fetch"):
+                results = cur.fetchall()
+
+        timings.rows = (timings.rows or 0) + len(results)
+        return [desc[0] for desc in cur.description], results
+
+    def _explain(
+        self,
+        cur: psycopg.Cursor,
+        sql: str,
+        params: dict[str, Any],
+        timings: OperationTimings,
+    ) -> None:
+        """
+        Record the executed plan of a search statement in `timings.explain`.
+        """
+        with timings.stage("explain"):
+            cur.execute(_explain_sql(sql), params)
+            plan = cur.fetchone()[0]
+        timings.explain.append(plan)
+        logger.info(
+            f"EXPLAIN ANALYZE {timings.operation}: "
+            f"execution {plan[0]['Execution Time']:.2f}ms, "
+            f"planning {plan[0]['Planning Time']:.2f}ms"
+        )
+
+    def _iter_server_cursor(
+        self,
+        cur: psycopg.Cursor,
+        sql: str,
+        params: dict[str, Any],
+        itersize: int,
+        timings: OperationTimings,
+        settings: dict[str, str] | None = None,
+        binary: bool = False,
+    ) -> Iterator[tuple[list[str], list[tuple]]]:
+        """
+        Run a statement behind a named server-side cursor and yield its column
+        names and rows, `itersize` rows at a time.
+
+        The cursor and the settings live in a transaction on the connection of
+        `cur`, which is committed when the iterator is exhausted or closed.
+        """
+        conn = cur.connection
+        try:
+            if settings:
+                cur.execute(*_set_config(settings))
+            name = f"pgsql_search_{next(_cursor_ids)}"
+            with conn.cursor(name=name, binary=binary) as stream:
+                stream.itersize = itersize
+                with timings.stage("execute"):
+                    stream.execute(sql, params)
+                columns = None
+                while True:
+                    with timings.stage("fetch"):
+                        results = stream.fetchmany(itersize)
+                    if not results:
+                        break
+                    timings.rows = (timings.rows or 0) + len(results)
+                    columns = columns or [desc[0] for desc in stream.description]
+                    yield columns, results
+        finally:
+            conn.commit()
+
     @staticmethod
     def create_database(database_name: str) -> None:
         """
@@ -1,7 +1,15 @@
+import glob
+import io
 import os
+from collections import Counter
+from collections.abc import Iterator
 
-from datasets import load_dataset
+import pyarrow as pa
+from datasets import Image, load_dataset
 from loguru import logger
+from PIL import Image as PILImage
+
+JPEG_MAGIC = b"\xff\xd8\xff"
 
 
 class HuggingFaceDatasets:
@@ -40,18 +48,176 @@ class HuggingFaceDatasets:
         self.dataset = self.dataset.select_columns(column_names)
         return self
 
-    def save_images(self, save_dir: str):
-        logger.info(f"Saving images to folder: {save_dir}")
+    def iter_arrow_batches(
+        self,
+        batch_size: int = 10_000,
+        columns: list[str] | None = None,
+        offset: int = 0,
+    ) -> Iterator[pa.Table]:
+        """
+        Iterate over the dataset as Arrow tables of at most `batch_size` rows.
+
+        Reads straight from the dataset's memory-mapped Arrow files, so only
+        one batch is held in memory at a time.
+
+        Args:
+            batch_size: Maximum number of rows per batch
+            columns: Columns to include (defaults to all columns)
+            offset: Number of leading rows to skip
 
-        def save_image_to_disk(example, save_dir):
-            filename = f"{example['image_id']}.jpg"
-            filepath = os.path.join(os.path.abspath(save_dir), filename)
-            example["image"].save(filepath)
-            return {"image_filepath": filepath}
+        Returns:
+            Iterator over pyarrow Tables
+        """
+        dataset = self.dataset
+        if columns is not None:
+            dataset = dataset.select_columns(columns)
+        if offset:
+            dataset = dataset.select(range(offset, len(dataset)))
+        return dataset.with_format("arrow").iter(batch_size=batch_size)
+
+    def save_images(
+        self,
+        save_dir: str,
+        num_proc: int = 8,
+        id_column: str = "image_id",
+        image_column: str = "image",
+        verify: str = "size",
+    ) -> "HuggingFaceDatasets":
+        """
+        Save the images of the dataset to `save_dir` and add their filepaths.
 
+        JPEG images are written with their original bytes instead of being
+        decoded and re-encoded. Files are written to a temporary name and
+        renamed once complete, so an interrupted run never leaves a truncated
+        image behind; temporary files of an interrupted run are removed. Images whose file already exists are skipped, which makes
+        a rerun after an interruption only write the missing files.
+
+        Args:
+            save_dir: Folder to save the images to
+            num_proc: Number of worker processes
+            id_column: Column used to name the files `<id>.jpg`. The row index
+                is used when the dataset has no such column
+            image_column: Column holding the images
+            verify: How an existing file is checked before it is skipped:
+                "size" compares the file size with the image's, "hash" compares
+                the contents. Files re-encoded from another format only need to
+                exist
+
+        Returns:
+            HuggingFaceDatasets with an `image_filepath` column
+        """
+        if verify not in ("size", "hash"):
+            raise ValueError(f"Unknown verify mode '{verify}', use 'size' or 'hash'")
+
+        save_dir = os.path.abspath(save_dir)
         os.makedirs(save_dir, exist_ok=True)
+        logger.info(f"Saving images to folder: {save_dir}")
+        _remove_temp_files(save_dir)
+
+        columns = [image_column]
+        if id_column in self.dataset.column_names:
+            columns.append(id_column)
+        else:
+            logger.warning(
+                f"Column '{id_column}' not found, naming images by row index"
+            )
+
+        def save_batch(batch, indices):
+            ids = batch.get(id_column, indices)
+            return {
+                "status": [
+                    _save_image_file(
+                        image, os.path.join(save_dir, f"{id_}.jpg"), verify
+                    )
+                    for image, id_ in zip(batch[image_column], ids)
+                ]
+            }
 
-        # Update the dataset in place with new image filepaths
-        self.dataset = self.dataset.map(
-            lambda x: save_image_to_disk(x, save_dir), desc="Saving images", num_proc=8
+        statuses = (
+            self.dataset.select_columns(columns)
+            .cast_column(image_column, Image(decode=False))
+            .map(
+                save_batch,
+                with_indices=True,
+                batched=True,
+                batch_size=100,
+                num_proc=num_proc,
+                remove_columns=columns,
+                load_from_cache_file=False,
+                desc="Saving images",
+            )["status"]
         )
+        counts = Counter(statuses)
+        logger.info(
+            f"Saved images: {counts['written']} written, "
+            f"{counts['skipped']} already present, {counts['failed']} failed"
+        )
+
+        ids = (
+            self.dataset[id_column]
+            if id_column in self.dataset.column_names
+            else range(len(self.dataset))
+        )
+        filepaths = [os.path.join(save_dir, f"{id_}.jpg") for id_ in ids]
+        if "image_filepath" in self.dataset.column_names:
+            self.dataset = self.dataset.remove_columns("image_filepath")
+        self.dataset = self.dataset.add_column("image_filepath", filepaths)
+        return self
+
+
+def _remove_temp_files(save_dir: str) -> None:
+    """
+    Remove temporary files left behind by a run that was interrupted mid-write.
+    """
+    stale = glob.glob(os.path.join(save_dir, "*.jpg.*.tmp"))
+    for path in stale:
+        os.remove(path)
+    if stale:
+        logger.info(f"Removed {len(stale)} incomplete files from {save_dir}")
+
+
+def _save_image_file(image: dict, filepath: str, verify: str) -> str:
+    """
+    Write an undecoded dataset image to `filepath` as JPEG, atomically.
+
+    Returns "written", "skipped" when an identical file already exists, or
+    "failed".
+    """
+    try:
+        data = image["bytes"]
+        if data is None:
+            with open(image["path"], "rb") as f:
+                data = f.read()
+
+        if not data.startswith(JPEG_MAGIC):
+            if os.path.exists(filepath):
+                return "skipped"
+            buffer = io.BytesIO()
+            PILImage.open(io.BytesIO(data)).convert("RGB").save(buffer, "JPEG")
+            data = buffer.getvalue()
+        elif _same_file(filepath, data, verify):
+            return "skipped"
+
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, filepath)
+        return "written"
+    except Exception as e:
+        logger.error(f"Error saving image {filepath}: {e}")
+        return "failed"
+
+
+def _same_file(filepath: str, data: bytes, verify: str) -> bool:
+    """
+    Check whether `filepath` already holds `data`, by size or by content.
+    """
+    try:
+        if os.path.getsize(filepath) != len(data):
+            return False
+    except OSError:
+        return False
+    if verify == "size":
+        return True
+    with open(filepath, "rb") as f:
+        return f.read() == data
@@ -0,0 +1,118 @@
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from loguru import logger
+
+
+@dataclass
+class OperationTimings:
+    """
+    Timings of one search or ingest operation, broken down by stage.
+
+    Stage durations are in seconds and accumulate if a stage runs more than
+    once (e.g. "execute" for every statement of a batch search). Typical stages
+    are "embedding", "execute", "fetch", "materialize", "render" and "write".
+    """
+
+    operation: str
+    stages: dict[str, float] = field(default_factory=dict)
+    total: float = 0.0
+    rows: int | None = None
+    explain: list[Any] = field(default_factory=list)
+    error: str | None = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as stage `name`."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + (
+                time.perf_counter() - start
+            )
+
+
+class Metrics:
+    """
+    Collect per-stage timings of database operations and pass them to callbacks.
+
+    Every search and ingest method of `PostgreSQLDatabase` records an
+    `OperationTimings` which is stored in `last` and passed to each callback,
+    e.g. to feed a monitoring system. Operations opened while another one is
+    active are recorded into the outer one, so that the caller can time its
+    own stages (such as query embedding) together with the search. Only
+    operations of the same `Metrics` instance are joined.
+
+    With `explain=True`, every search statement is also run through
+    `EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON)` and the plans are stored in
+    `OperationTimings.explain`. This executes each statement twice, so only
+    enable it to diagnose slow queries.
+
+    Examples:
+        metrics = Metrics(callbacks=[lambda t: statsd.timing(t.operation, t.total)])
+        db = PostgreSQLDatabase("my_database", metrics=metrics)
+
+        with metrics.operation("hybrid_search") as op:
+            with op.stage("embedding"):
+                embedding = clip.encode_text(query)
+            db.search_hybrid(query, embedding, "image_metadata", "caption", "img_emb")
+        print(op.stages)
+    """
+
+    def __init__(
+        self,
+        callbacks: list[Callable[[OperationTimings], None]] | None = None,
+        explain: bool = False,
+    ) -> None:
+        self.callbacks = list(callbacks or [])
+        self.explain = explain
+        self.last: OperationTimings | None = None
+        # The operation active in the current context, per instance
+        self._current: ContextVar[OperationTimings | None] = ContextVar(
+            f"metrics_{id(self)}", default=None
+        )
+
+    def add_callback(self, callback: Callable[[OperationTimings], None]) -> None:
+        self.callbacks.append(callback)
+
+    @contextmanager
+    def operation(
+        self, name: str, detached: bool = False
+    ) -> Iterator[OperationTimings]:
+        """
+        Record an operation, or join the operation that is already active.
+
+        A `detached` operation neither joins nor becomes the active operation.
+        Generators use it, since they yield to their caller in the middle of
+        the operation, and the caller's own operations must not be merged
+        into it. Its total then includes the time spent by the caller between
+        batches.
+        """
+        current = None if detached else self._current.get()
+        if current is not None:
+            yield current
+            return
+
+        timings = OperationTimings(name)
+        token = None if detached else self._current.set(timings)
+        start = time.perf_counter()
+        try:
+            yield timings
+        except Exception as e:
+            timings.error = repr(e)
+            raise
+        finally:
+            timings.total = time.perf_counter() - start
+            if token is not None:
+                self._current.reset(token)
+            self.last = timings
+            for callback in self.callbacks:
+                try:
+                    callback(timings)
+                except Exception as e:
+                    logger.error(f"Error in metrics callback: {e}")
@@ -0,0 +1,50 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from pgsql_search.async_database import AsyncPostgreSQLDatabase
+from pgsql_search.database import _filter_params, _fts_sql
+
+
+class RecordingCursor:
+    def __init__(self, rows, columns):
+        self.rows = rows
+        self.description = [(name,) for name in columns]
+        self.executed = []
+
+    async def execute(self, sql, params=None, binary=False):
+        self.executed.append((sql, params))
+
+    async def fetchall(self):
+        return self.rows
+
+
+def test_full_text_search_runs_the_shared_statement():
+    table_columns = {"id": "int4", "caption": "text", "source": "text"}
+    cur = RecordingCursor(
+        [(1, "a dog", "coco", 0.5)], ["id", "caption", "source", "search_rank"]
+    )
+    db = AsyncPostgreSQLDatabase("unused")
+    db._table_columns["items"] = table_columns
+
+    @asynccontextmanager
+    async def cursor():
+        yield cur
+
+    db._cursor = cursor
+    rows = asyncio.run(
+        db.full_text_search(
+            "dog",
+            "items",
+            "caption",
+            filters={"source": "coco"},
+            return_dataframe=False,
+        )
+    )
+
+    filter_key, filter_params = _filter_params({"source": "coco"})
+    sql, params = cur.executed[0]
+    assert sql == _fts_sql(
+        "items", "caption", tuple(table_columns.items()), "english", filter_key
+    )
+    assert params == {"query": "dog", "num_results": 10, **filter_params}
+    assert rows[0].source == "coco"
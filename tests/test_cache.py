@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from pgsql_search.cache import EmbeddingCache, LRUCache
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert cache.get("c") == 3
+    assert cache.get("b") is None
+    assert cache.info() == {"hits": 2, "misses": 1, "size": 2, "maxsize": 2}
+
+
+def test_lru_cache_disabled_with_zero_size():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+
+    assert len(cache) == 0
+    assert cache.get("a") is None
+
+
+def test_embedding_cache_persists_and_drops_partial_writes(tmp_path):
+    cache = EmbeddingCache(tmp_path, "org/model", dim=4)
+    keys = [EmbeddingCache.hash_bytes(b"a"), EmbeddingCache.hash_bytes(b"b")]
+    embeddings = np.arange(8, dtype=np.float32).reshape(2, 4)
+
+    assert cache.put(keys + keys[:1], np.vstack([embeddings, embeddings[:1]])) == 2
+
+    # An interrupted write leaves a vector without its key
+    with open(cache.path / "vectors.f32", "ab") as f:
+        f.write(np.ones(4, dtype=np.float32).tobytes())
+
+    reopened = EmbeddingCache(tmp_path, "org/model", dim=4)
+    assert len(reopened) == 2
+    assert reopened.lookup([keys[1], None, b"x" * 16]).tolist() == [1, -1, -1]
+    np.testing.assert_array_equal(reopened.get(keys[0]), embeddings[0])
+    assert reopened.info() == {"hits": 2, "misses": 2, "size": 2}
+
+    with pytest.raises(ValueError):
+        EmbeddingCache(tmp_path, "org/model", dim=8)
@@ -0,0 +1,521 @@
+import contextlib
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from psycopg.adapt import PyFormat, Transformer
+
+from pgsql_search.database import (
+    Column,
+    ColumnType,
+    DistanceMetric,
+    PostgreSQLDatabase,
+    SearchResult,
+    _cast_integer_rows,
+    _cluster_pairs,
+    _conform_batch,
+    _decode_page_token,
+    _encode_page_token,
+    _export_columns,
+    _filter_params,
+    _fts_page_sql,
+    _fts_sql,
+    _group_results,
+    _hybrid_search_sql,
+    _iter_arrow_rows,
+    _iter_dataframe_rows,
+    _materialize,
+    _partition_strategy,
+    _quantize_rows,
+    _quantized_columns,
+    _rerank_search_sql,
+    _search_settings,
+    _skip_rows,
+    _to_arrow,
+    _to_numpy,
+    _to_rows,
+    _upsert_sql,
+    _vector_search_sql,
+)
+
+
+def test_iter_dataframe_rows_replaces_missing_values():
+    df = pd.DataFrame(
+        {
+            "id": [1, 2, 3],
+            "caption": ["a cat", None, np.nan],
+            "score": [0.5, np.nan, 1.0],
+        }
+    )
+
+    rows = list(_iter_dataframe_rows(df, chunk_size=2))
+
+    assert rows == [(1, "a cat", 0.5), (2, None, None), (3, None, 1.0)]
+
+
+def test_distance_metric_operator_classes():
+    assert DistanceMetric.COSINE.operator == "<=>"
+    assert DistanceMetric.L2.opclass() == "vector_l2_ops"
+    assert DistanceMetric.INNER_PRODUCT.opclass("vector") == "vector_ip_ops"
+
+
+def test_iter_arrow_rows_stacks_embeddings():
+    table = pa.table(
+        {
+            "caption": ["a cat", None, "a dog"],
+            "img_emb": [[1.0, 0.0], [0.0, 1.0], [1.0, 1.0]],
+        }
+    )
+
+    rows = list(_iter_arrow_rows(table.slice(1), ["caption", "img_emb"]))
+
+    assert [row[0] for row in rows] == [None, "a dog"]
+    np.testing.assert_array_equal(rows[1][1], np.array([1.0, 1.0], dtype=np.float32))
+
+
+def test_skip_rows_across_batches():
+    table = pa.table({"id": list(range(5))})
+
+    batches = list(_skip_rows(table.to_batches(max_chunksize=2), 3))
+
+    assert [batch.column("id").to_pylist() for batch in batches] == [[3], [4]]
+
+
+def test_fts_sql_is_parameterized_and_cached():
+    columns = (("id", "int4"), ("caption", "text"), ("caption_tsv", "tsvector"))
+
+    sql = _fts_sql("image_metadata", "caption", columns)
+
+    assert "LIMIT %(num_results)s" in sql
+    assert "caption_tsv @@ parsed_query" in sql
+    assert "image_metadata.caption_tsv," not in sql
+    assert _fts_sql("image_metadata", "caption", columns) is sql
+
+
+def test_group_results_keeps_query_order_and_empty_queries():
+    rows = [(1, 5, 0.1), (1, 6, 0.2), (3, 7, 0.3)]
+
+    groups = _group_results(["query_index", "id", "distance"], rows, num_queries=3)
+
+    assert [group["id"].tolist() for group in groups] == [[5, 6], [], [7]]
+    assert list(groups[1].columns) == ["id", "distance"]
+
+    empty = _group_results(["query_index", "id"], [(2, 5)], num_queries=3)
+    empty[0]["score"] = []
+    assert "score" not in empty[2].columns
+
+
+def test_quantize_rows_converts_halfvec_and_bit_columns():
+    embedding = np.array([0.5, -1.0, 2.0], dtype=np.float32)
+    rows = list(_quantize_rows([(1, embedding, embedding)], ["int4", "halfvec", "bit"]))
+
+    _, half, bits = rows[0]
+    assert half.to_numpy().dtype.kind == "f"
+    assert np.allclose(half.to_list(), embedding)
+    assert bits.to_text() == "101"
+
+
+def test_quantized_columns_and_rerank_sql():
+    table_columns = {"id": "int4", "img_emb": "vector", "img_emb_bit": "bit"}
+    columns, sources = _quantized_columns(
+        ["id", "img_emb"], {"img_emb_bit": "img_emb"}, table_columns
+    )
+    assert columns == ["id", "img_emb", "img_emb_bit"]
+    assert sources == ["id", "img_emb", "img_emb"]
+    assert Column("b", ColumnType.BIT, vector_dim=8).get_sql_definition() == "b bit(8)"
+
+    sql = _rerank_search_sql(
+        "items",
+        "img_emb",
+        "img_emb_bit",
+        tuple(table_columns.items()),
+        DistanceMetric.COSINE,
+        DistanceMetric.HAMMING,
+    )
+    assert "items.img_emb_bit <~> binary_quantize(%(embedding)s)" in sql
+    assert "SELECT items.id," in sql
+    assert "LIMIT %(candidates)s" in sql
+    assert "LIMIT %(num_results)s" in sql
+
+
+def test_rerank_settings_fetch_every_candidate():
+    assert _search_settings(candidates=200) == {"hnsw.ef_search": "200"}
+    assert _search_settings(candidates=20) == {}
+    assert _search_settings(candidates=5000) == {"hnsw.ef_search": "1000"}
+    assert _search_settings(ef_search=300, candidates=200) == {"hnsw.ef_search": "300"}
+
+
+def test_hybrid_search_sql_fuses_both_legs():
+    table_columns = (
+        ("id", "int4"),
+        ("caption", "text"),
+        ("caption_tsv", "tsvector"),
+        ("source", "text"),
+        ("img_emb", "vector"),
+    )
+    filter_key, _ = _filter_params({"source": "coco"})
+
+    sql = _hybrid_search_sql(
+        "items",
+        "caption",
+        "img_emb",
+        "id",
+        table_columns,
+        DistanceMetric.COSINE,
+        filters=filter_key,
+    )
+
+    vector_leg, rest = sql.split("text_leg AS")
+    text_leg, fused = rest.split("fused AS")
+    assert "LIMIT %(vector_candidates)s" in vector_leg
+    assert "LIMIT %(text_candidates)s" in text_leg
+    assert "items.caption_tsv @@ parsed_query" in text_leg
+    # The filter restricts both legs
+    assert "items.source = %(filter_source)s" in vector_leg
+    assert "items.source = %(filter_source)s" in text_leg
+    assert "%(vector_weight)s::float8 / (%(vector_k)s + vector_leg.rank)" in fused
+    assert "%(text_weight)s::float8 / (%(text_k)s + text_leg.rank)" in fused
+    assert "LIMIT %(num_results)s" in fused
+    output = fused.split("SELECT items.id")[1].split("FROM fused")[0]
+    for column in ("fused.score", "fused.text_rank", "fused.vector_rank"):
+        assert column in output
+    assert "img_emb" not in output
+
+
+def test_cluster_pairs_merges_linked_ids():
+    pairs = [(1, 2), (2, 1), (5, 4), (3, 2), (7, 8)]
+
+    assert _cluster_pairs(pairs) == [[1, 2, 3], [4, 5], [7, 8]]
+
+
+def test_upsert_sql_only_updates_changed_rows():
+    sql = _upsert_sql("items", "items_staging", ["key", "caption"], ["key"])
+
+    assert "ON CONFLICT (key) DO UPDATE SET caption = EXCLUDED.caption" in sql
+    assert "WHERE ROW(items.caption) IS DISTINCT FROM ROW(EXCLUDED.caption)" in sql
+    assert "ON CONFLICT (key) DO NOTHING" in _upsert_sql(
+        "items", "items_staging", ["key"], ["key"]
+    )
+
+
+def test_filters_become_parameters_of_a_cached_statement():
+    key, params = _filter_params({"year": 2024, "source": ["coco", "flickr"]})
+    assert key == (("source", "any"), ("year", "eq"))
+    assert params == {"filter_source": ["coco", "flickr"], "filter_year": 2024}
+
+    table_columns = (("id", "int4"), ("img_emb", "vector"))
+    sql = _vector_search_sql(
+        "items", "img_emb", table_columns, DistanceMetric.COSINE, key
+    )
+    assert (
+        "WHERE items.source = ANY(%(filter_source)s) "
+        "AND items.year = %(filter_year)s" in sql
+    )
+    assert "WHERE" not in _vector_search_sql(
+        "items", "img_emb", table_columns, DistanceMetric.COSINE
+    )
+
+
+def test_fts_page_sql_and_tokens():
+    columns = (("id", "int4"), ("caption", "text"))
+
+    first = _fts_page_sql("items", "caption", columns)
+    after = _fts_page_sql("items", "caption", columns, keyset=True)
+    stream = _fts_page_sql("items", "caption", columns, limit=False)
+
+    assert "ORDER BY search_rank DESC, id" in first
+    assert "after_rank" not in first
+    assert "search_rank < %(after_rank)s::real" in after
+    assert "search_rank = %(after_rank)s::real AND id > %(after_id)s" in after
+    assert "LIMIT" not in stream
+
+    token = _encode_page_token(0.1, 42)
+    assert _decode_page_token(token) == (0.1, 42)
+    with pytest.raises(ValueError):
+        _decode_page_token("not a token")
+
+
+def test_page_tokens_resume_after_tied_and_inexact_ranks():
+    # Ranks are real, returned in text mode as their shortest decimal, which is
+    # not the same number in double precision (0.1 and 0.7 are not exact)
+    ranks = np.float32([0.7, 0.7, 0.7, 0.1, 0.1, 0.1, 1 / 3, 1 / 3])
+    rows = sorted(
+        zip(ranks, range(1, len(ranks) + 1)), key=lambda row: (-row[0], row[1])
+    )
+    assert float(str(np.float32(0.1))) != float(np.float32(0.1))
+
+    def page(after, size=2):
+        # The keyset condition of _fts_page_sql, with the rank cast to real
+        if after is not None:
+            rank, row_id = _decode_page_token(after)
+            rank = np.float32(rank)
+            rows_after = [
+                row
+                for row in rows
+                if row[0] < rank or (row[0] == rank and row[1] > row_id)
+            ]
+        else:
+            rows_after = rows
+        hits = rows_after[:size]
+        token = None
+        if len(hits) == size:
+            last_rank, last_id = hits[-1]
+            token = _encode_page_token(float(str(last_rank)), last_id)
+        return hits, token
+
+    seen, token = page(None)
+    while token is not None:
+        hits, token = page(token)
+        seen += hits
+    assert [row_id for _, row_id in seen] == [row_id for _, row_id in rows]
+
+
+def test_projection_and_result_rows():
+    table_columns = (("id", "int4"), ("caption", "text"), ("img_emb", "vector"))
+
+    sql = _vector_search_sql(
+        "items",
+        "img_emb",
+        table_columns,
+        DistanceMetric.COSINE,
+        projection=("caption",),
+    )
+    assert "SELECT items.caption," in sql
+    with pytest.raises(ValueError):
+        _fts_sql("items", "caption", table_columns, projection=("missing",))
+
+    rows = _to_rows(
+        [(1, "a cat", 0.5, "?")], ["id", "caption", "search_rank", "?column?"]
+    )
+    assert rows[0].caption == "a cat"
+    assert rows[0] == (1, "a cat", 0.5, "?")
+    assert list(SearchResult.to_dataframe(rows).columns) == [
+        "id",
+        "caption",
+        "search_rank",
+        "_3",
+    ]
+
+
+def test_columnar_results_stack_vectors():
+    rows = [(1, np.ones(3, dtype=np.float32)), (2, None)]
+
+    arrays = _materialize(rows, ["id", "img_emb"], columnar="numpy")
+    assert arrays["id"].tolist() == [1, 2]
+    assert arrays["img_emb"].dtype == np.float32
+    assert arrays["img_emb"].shape == (2, 3)
+    assert np.isnan(arrays["img_emb"][1]).all()
+
+    table = _materialize(rows, ["id", "img_emb"], columnar="arrow")
+    assert table.column("img_emb").type == pa.list_(pa.float32(), 3)
+    assert table.column("img_emb").null_count == 1
+
+    with pytest.raises(ValueError):
+        _materialize(rows, ["id", "img_emb"], columnar="parquet")
+
+
+def test_nullable_integer_columns_are_sent_as_int():
+    # The missing value turns the integer column into float64
+    df = pd.DataFrame({"year": [2020, None, 2022], "caption": ["a", "b", "c"]})
+
+    rows = list(
+        _cast_integer_rows(_iter_dataframe_rows(df, chunk_size=2), ["int4", "text"])
+    )
+
+    assert rows == [(2020, "a"), (None, "b"), (2022, "c")]
+    assert all(type(row[0]) is int for row in (rows[0], rows[2]))
+
+
+class RecordingCopy:
+    def __init__(self, written):
+        self.written = written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_types(self, types):
+        raise AssertionError("text COPY must not set binary types")
+
+    def write_row(self, row):
+        # Dump the values as psycopg does for text COPY
+        self.written.append(
+            Transformer().dump_sequence(row, [PyFormat.TEXT] * len(row))
+        )
+
+
+class RecordingCopyCursor:
+    def __init__(self):
+        self.sql = []
+        self.written = []
+        self.connection = self
+
+    def copy(self, sql):
+        self.sql.append(sql)
+        return RecordingCopy(self.written)
+
+    def commit(self):
+        pass
+
+
+def test_text_copy_sends_nullable_integers_as_int():
+    df = pd.DataFrame({"year": [2020, None], "caption": ["a", "b"]})
+    cur = RecordingCopyCursor()
+
+    total = PostgreSQLDatabase("unused")._copy_rows(
+        cur,
+        "items",
+        ["year", "caption"],
+        _iter_dataframe_rows(df, chunk_size=2),
+        types=["int4", "text"],
+        binary=False,
+    )
+
+    assert total == 2
+    assert "BINARY" not in cur.sql[0]
+    assert cur.written == [[b"2020", b"a"], [None, b"b"]]
+
+
+@pytest.mark.parametrize("columnar", ["arrow", "numpy"])
+def test_export_table_merges_batches_with_all_null_columns(monkeypatch, columnar):
+    # A column added later is NULL for every row of the first batch
+    columns = ["id", "caption", "emb"]
+    first = [(1, None, None), (2, None, None)]
+    second = [(3, "a dog", np.array([1.0, 2.0], dtype=np.float32)), (4, None, None)]
+    convert = _to_arrow if columnar == "arrow" else _to_numpy
+    db = PostgreSQLDatabase("unused")
+    monkeypatch.setattr(
+        db,
+        "iter_table",
+        lambda *args, **kwargs: iter(
+            [convert(first, columns), convert(second, columns)]
+        ),
+    )
+
+    result = db.export_table("items", columnar)
+
+    if columnar == "arrow":
+        assert result.schema.field("caption").type == pa.string()
+        assert result.schema.field("emb").type == pa.list_(pa.float32(), 2)
+        assert result.column("caption").to_pylist() == [None, None, "a dog", None]
+    else:
+        assert result["emb"].shape == (4, 2)
+        assert np.isnan(result["emb"][[0, 1, 3]]).all()
+        assert result["emb"][2].tolist() == [1.0, 2.0]
+
+
+def test_conform_batch_keeps_types_of_earlier_batches():
+    schema = {}
+    _conform_batch(_to_arrow([(1, "a")], ["id", "caption"]), schema)
+
+    batch = _conform_batch(_to_arrow([(2, None)], ["id", "caption"]), schema)
+
+    assert batch.schema.field("caption").type == pa.string()
+
+
+def test_export_columns_of_an_empty_export():
+    table_columns = (("id", "int4"), ("caption", "text"), ("caption_tsv", "tsvector"))
+
+    assert _export_columns(table_columns) == ("id", "caption")
+    assert _export_columns(table_columns, ("caption",)) == ("caption",)
+    assert list(_to_numpy([], ["id", "caption"])) == ["id", "caption"]
+
+
+def test_partition_strategy_rejects_incomplete_or_mixed_bounds():
+    assert _partition_strategy(["coco"], None, None, None, None) == "list"
+    assert _partition_strategy(None, 1, 10, None, None) == "range"
+    assert _partition_strategy(None, None, None, 4, 0) == "hash"
+    assert _partition_strategy(None, None, None, None, None) == "default"
+    with pytest.raises(ValueError, match="modulus and remainder"):
+        _partition_strategy(None, None, None, 4, None)
+    with pytest.raises(ValueError, match="modulus and remainder"):
+        _partition_strategy(None, None, None, None, 0)
+    with pytest.raises(ValueError, match="start and end"):
+        _partition_strategy(None, 1, None, None, None)
+    with pytest.raises(ValueError, match="list and hash"):
+        _partition_strategy(["coco"], None, None, 4, 0)
+    with pytest.raises(ValueError):
+        PostgreSQLDatabase("unused").add_partition("items", "items_p0", modulus=4)
+
+
+class UpsertCursor(RecordingCopyCursor):
+    def __init__(self, table_columns, partition_key):
+        super().__init__()
+        self.results = {
+            "pg_partitioned_table": partition_key,
+            "udt_name": table_columns,
+        }
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append(sql)
+
+    def fetchall(self):
+        last = self.executed[-1]
+        return next(rows for key, rows in self.results.items() if key in last)
+
+    def fetchone(self):
+        return (1, 1)
+
+
+def test_upsert_adds_the_partition_key_to_the_conflict_key():
+    db = PostgreSQLDatabase("unused")
+    db.table_name = "items"
+    cur = UpsertCursor(
+        [("id", "int4"), ("source", "text"), ("image_id", "int4"), ("caption", "text")],
+        [("source",)],
+    )
+    db._cursor = lambda: contextlib.nullcontext(cur)
+    df = pd.DataFrame(
+        {"image_id": [1, 2], "source": ["coco", "coco"], "caption": ["a", "b"]}
+    )
+
+    assert db.upsert_dataframe(df, "image_id", binary=False) == (1, 1)
+
+    statements = "\n".join(cur.executed)
+    assert "ON items (image_id, source)" in statements
+    assert "ON CONFLICT (image_id, source)" in statements
+
+
+class FailingIndexCursor(UpsertCursor):
+    def __init__(self):
+        super().__init__([("id", "int4"), ("img_emb", "vector")], [])
+        self.results["pg_inherits"] = []
+        self.autocommit = False
+
+    def execute(self, sql, params=None):
+        super().execute(sql, params)
+        if sql.startswith("CREATE INDEX"):
+            raise RuntimeError("build failed")
+
+
+def test_failed_concurrent_index_build_resets_the_session():
+    db = PostgreSQLDatabase("unused")
+    cur = FailingIndexCursor()
+    db._cursor = lambda: contextlib.nullcontext(cur)
+
+    with pytest.raises(RuntimeError, match="build failed"):
+        db.create_vector_index(
+            "items",
+            "img_emb",
+            maintenance_work_mem="2GB",
+            max_parallel_workers=4,
+            concurrently=True,
+        )
+
+    assert cur.executed[-2:] == [
+        "RESET maintenance_work_mem",
+        "RESET max_parallel_maintenance_workers",
+    ]
+    assert cur.autocommit is False
+
+
+@pytest.mark.parametrize("page_size", [0, -1])
+def test_page_size_must_be_positive(page_size):
+    with pytest.raises(ValueError, match="page_size"):
+        PostgreSQLDatabase("unused").full_text_search_page(
+            "dog", "items", "caption", page_size=page_size
+        )
@@ -1,3 +1,31 @@
+import subprocess
+import sys
+
 import pgsql_search as ps
 
-ps.search_fts()
\ No newline at end of file
+ps.search_fts("query")
+
+HEAVY_MODULES = [
+    "numpy",
+    "pandas",
+    "datasets",
+    "pyarrow",
+    "pgvector",
+    "torch",
+    "itables",
+]
+
+
+def test_search_modules_do_not_import_heavy_dependencies():
+    code = (
+        "import sys, pgsql_search\n"
+        "pgsql_search.search_fts\n"
+        "from pgsql_search.database import PostgreSQLDatabase\n"
+        "from pgsql_search.async_database import AsyncPostgreSQLDatabase\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+
+    assert result.stdout.strip() == ""
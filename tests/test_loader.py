@@ -0,0 +1,51 @@
+import os
+
+from datasets import Dataset, Features, Image, Value
+from PIL import Image as PILImage
+
+from pgsql_search.loader import HuggingFaceDatasets
+
+
+def make_dataset(tmp_path, with_ids=True):
+    paths = []
+    for i, fmt in enumerate(["JPEG", "PNG"]):
+        path = tmp_path / f"source_{i}.{fmt.lower()}"
+        PILImage.new("RGB", (8, 8), (i * 100, 0, 0)).save(path, fmt)
+        paths.append(str(path))
+    data = {"image": paths}
+    features = {"image": Image()}
+    if with_ids:
+        data["image_id"] = [10, 11]
+        features["image_id"] = Value("int64")
+
+    ds = HuggingFaceDatasets.__new__(HuggingFaceDatasets)
+    ds.dataset = Dataset.from_dict(data, features=Features(features))
+    return ds
+
+
+def test_save_images_is_idempotent(tmp_path):
+    ds = make_dataset(tmp_path)
+    save_dir = tmp_path / "images"
+
+    ds.save_images(str(save_dir), num_proc=1)
+    filepaths = ds.dataset["image_filepath"]
+    assert [os.path.basename(p) for p in filepaths] == ["10.jpg", "11.jpg"]
+    with open(tmp_path / "source_0.jpeg", "rb") as f, open(filepaths[0], "rb") as saved:
+        assert saved.read() == f.read()
+    mtimes = [os.path.getmtime(p) for p in filepaths]
+
+    (save_dir / "12.jpg.123.tmp").write_bytes(b"partial")
+    ds.save_images(str(save_dir), num_proc=1, verify="hash")
+    assert [os.path.getmtime(p) for p in filepaths] == mtimes
+    assert sorted(os.listdir(save_dir)) == ["10.jpg", "11.jpg"]
+
+
+def test_save_images_falls_back_to_row_index(tmp_path):
+    ds = make_dataset(tmp_path, with_ids=False)
+
+    ds.save_images(str(tmp_path / "images"), num_proc=1)
+
+    assert [os.path.basename(p) for p in ds.dataset["image_filepath"]] == [
+        "0.jpg",
+        "1.jpg",
+    ]
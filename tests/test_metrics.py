@@ -0,0 +1,67 @@
+import pytest
+
+from pgsql_search.metrics import Metrics
+
+
+def test_nested_operations_share_timings():
+    received = []
+    metrics = Metrics(callbacks=[received.append])
+
+    with metrics.operation("outer") as outer:
+        with outer.stage("embedding"):
+            pass
+        with metrics.operation("inner") as inner, inner.stage("execute"):
+            pass
+
+    assert inner is outer
+    assert received == [outer]
+    assert metrics.last is outer
+    assert set(outer.stages) == {"embedding", "execute"}
+    assert outer.total >= sum(outer.stages.values())
+
+
+def test_failed_operation_is_reported():
+    metrics = Metrics()
+    with pytest.raises(ValueError), metrics.operation("search"):
+        raise ValueError("boom")
+
+    assert metrics.last.error == "ValueError('boom')"
+
+
+def test_operations_of_other_instances_are_not_joined():
+    outer_received, inner_received = [], []
+    outer_metrics = Metrics(callbacks=[outer_received.append])
+    inner_metrics = Metrics(callbacks=[inner_received.append])
+
+    with (
+        outer_metrics.operation("outer") as outer,
+        inner_metrics.operation("inner") as inner,
+        inner.stage("execute"),
+    ):
+        pass
+
+    assert inner is not outer
+    assert inner_received == [inner]
+    assert outer_received == [outer]
+    assert "execute" not in outer.stages
+
+
+def test_detached_operation_is_not_joined():
+    received = []
+    metrics = Metrics(callbacks=[received.append])
+
+    def stream():
+        with metrics.operation("stream", detached=True) as timings:
+            with timings.stage("fetch"):
+                pass
+            yield 1
+            yield 2
+
+    batches = stream()
+    next(batches)
+    with metrics.operation("search") as search:
+        pass
+    batches.close()
+
+    assert [t.operation for t in received] == ["search", "stream"]
+    assert search is not received[1]
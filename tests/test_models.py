@@ -0,0 +1,99 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+
+from pgsql_search.cache import EmbeddingCache
+from pgsql_search.models import CLIP, InferenceBackend
+
+
+def _cached_clip(tmp_path, num_images, dim=4):
+    paths = []
+    for i in range(num_images):
+        path = tmp_path / f"{i}.jpg"
+        path.write_bytes(f"image {i}".encode())
+        paths.append(str(path))
+    cache = EmbeddingCache(tmp_path / "cache", "org/model", dim=dim)
+    cache.put(
+        [EmbeddingCache.hash_file(path) for path in paths],
+        np.arange(num_images * dim, dtype=np.float32).reshape(num_images, dim),
+    )
+    clip = CLIP.__new__(CLIP)
+    clip.embedding_cache = cache
+    clip.model = SimpleNamespace(config=SimpleNamespace(projection_dim=dim))
+    return clip, paths
+
+
+def test_encode_image_serves_cached_embeddings_without_copying(tmp_path):
+    clip, paths = _cached_clip(tmp_path, 3)
+
+    embeddings = clip.encode_image(paths[1:])
+
+    assert np.shares_memory(embeddings, clip.embedding_cache.vectors)
+    assert not embeddings.flags.writeable
+    np.testing.assert_array_equal(embeddings, clip.embedding_cache.vectors[1:])
+
+
+def test_encode_image_copies_cached_embeddings_out_of_order(tmp_path):
+    clip, paths = _cached_clip(tmp_path, 3)
+
+    embeddings = clip.encode_image(paths[::-1])
+
+    assert not np.shares_memory(embeddings, clip.embedding_cache.vectors)
+    np.testing.assert_array_equal(embeddings, clip.embedding_cache.vectors[::-1])
+
+
+TINY_MODEL = "hf-internal-testing/tiny-random-CLIPModel"
+
+BACKENDS = [
+    ("eager", True),
+    ("torchscript", False),
+    ("torchscript", True),
+    ("onnx", False),
+    ("onnx", True),
+]
+
+
+def test_variant_id_differs_per_backend():
+    variant_ids = set()
+    for backend, quantize in [("eager", False), *BACKENDS]:
+        clip = CLIP.__new__(CLIP)
+        clip.model_id, clip.backend, clip.quantize = (
+            TINY_MODEL,
+            InferenceBackend(backend),
+            quantize,
+        )
+        variant_ids.add(clip.variant_id)
+
+    # Cache keys depend on the variant, so no two backends may share one
+    assert len(variant_ids) == len(BACKENDS) + 1
+    assert TINY_MODEL in variant_ids
+
+
+@pytest.mark.parametrize(("backend", "quantize"), BACKENDS)
+def test_backends_match_the_eager_model(tmp_path, backend, quantize):
+    if backend == "onnx":
+        pytest.importorskip("onnx")
+        pytest.importorskip("onnxruntime")
+    image_path = tmp_path / "image.jpg"
+    Image.new("RGB", (32, 32), (200, 30, 30)).save(image_path)
+    try:
+        clip = CLIP(
+            TINY_MODEL,
+            device="cpu",
+            backend=backend,
+            quantize=quantize,
+            export_dir=tmp_path / "onnx",
+        )
+    except OSError as e:
+        pytest.skip(f"{TINY_MODEL} is not available: {e}")
+
+    similarity = clip.check_accuracy(["a red square", "a dog"], [str(image_path)])
+
+    tolerance = 0.9 if quantize else 0.999
+    assert similarity["text"] >= tolerance
+    assert similarity["image"] >= tolerance